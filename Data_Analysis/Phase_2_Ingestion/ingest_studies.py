@@ -1,51 +1,196 @@
 import os
-import pandas as pd
+import sys
 import json
 import hashlib
 import uuid
 import datetime
 import argparse
+import functools
+import glob
 import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from jsonschema import Draft7Validator, ValidationError
+
+if not __package__:
+    # `python Phase_2_Ingestion/ingest_studies.py`: only the script's own folder is on sys.path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline.config import PipelineConfig
+from pipeline.lazy import lazy_import
+from pipeline.metrics import METRICS, timed
+from pipeline.schema import apply_schema, read_table, write_table
+from pipeline.subject_store import INDEX_FILE, build_subject_index, cluster_by_subject
+
+# Imported on first use, so importing this module stays cheap and side-effect free
+pd = lazy_import('pandas')
+jsonschema = lazy_import('jsonschema')
 
 # Configuration
-BASE_DIR = Path("/Users/mypro16/Desktop/Novaratis/Data for problem Statement 1")
+# Paths resolve relative to the Data_Analysis folder unless PIPELINE_BASE_DIR overrides them
+BASE_DIR = Path(os.environ.get("PIPELINE_BASE_DIR", Path(__file__).resolve().parent.parent))
 SOURCE_DIR = BASE_DIR / "Phase_1_Standardization/Standardized_Study_Files"
 CANONICAL_DIR = BASE_DIR / "Phase_2_Ingestion/Canonical_Data"
 QUARANTINE_DIR = CANONICAL_DIR / "Quarantine"
 SCHEMA_PATH = BASE_DIR / "Phase_2_Ingestion/Deliverables/Schema_Registry/canonical_schema_v1.json"
 MAPPING_PATH = BASE_DIR / "Phase_2_Ingestion/Deliverables/field_mapping.csv"
-
-# Ensure directories exist
-os.makedirs(CANONICAL_DIR, exist_ok=True)
-os.makedirs(QUARANTINE_DIR, exist_ok=True)
-
-# Global Schema
-try:
-    with open(SCHEMA_PATH, 'r') as f:
-        CANONICAL_SCHEMA = json.load(f)
-except Exception as e:
-    print(f"CRITICAL: Could not load schema from {SCHEMA_PATH}")
-    raise e
-
-# Pre-compile validators for speed
-VALIDATORS = {}
-for entity_name, entity_def in CANONICAL_SCHEMA.get('definitions', {}).items():
-    VALIDATORS[entity_name] = Draft7Validator(entity_def)
-
-# Logging Setup
-logging.basicConfig(
-    filename=BASE_DIR / 'Phase_2_Ingestion/phase2_ingestion.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-logging.getLogger('').addHandler(console)
+LOG_FILE = BASE_DIR / "Phase_2_Ingestion/phase2_ingestion.log"
+
+@functools.lru_cache(maxsize=None)
+def load_schema(schema_path=SCHEMA_PATH):
+    try:
+        with open(schema_path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"CRITICAL: Could not load schema from {schema_path}")
+        raise e
+
+@functools.lru_cache(maxsize=None)
+def compile_validators(schema_path=SCHEMA_PATH):
+    # One Draft7Validator per schema definition, compiled once per process and schema file
+    return {
+        entity_name: jsonschema.Draft7Validator(entity_def)
+        for entity_name, entity_def in load_schema(schema_path).get('definitions', {}).items()
+    }
+
+def setup_logging(log_file=LOG_FILE):
+    # Log to the phase log file and the console. Called by the entry points (CLI, pipeline
+    # stage), never at import, and a no-op once the process has configured logging itself.
+    root = logging.getLogger('')
+    if root.handlers:
+        return
+    Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    root.addHandler(console)
+
+# Sheet each parser reads, keyed by the file-name marker route_file dispatches on (same
+# order). The coding reports fall back to their first sheet when the named one is missing.
+SHEETS = {
+    "EDC_Metrics": "Query Report - Cumulative",
+    "EDRR": "OpenIssuesSummary",
+    "MedDRA": "GlobalCodingReport_MedDRA",
+    "WHODrug": "GlobalCodingReport_WHODD",
+    "Inactivated_Records": 0,
+    "Lab_Discrepancies": "Missing_Lab_Name_and_Missing",
+    "Missing_Pages": "All Pages Missing",
+    "Visit_Projection": "Missing Visits",
+    "SAE_Dashboard": "SAE Dashboard_Safety",
+}
+FIRST_SHEET_FALLBACK = {"MedDRA", "WHODrug"}
+
+def sheet_for(file_name):
+    # (sheet_name, fallback) the parser of `file_name` will ask for, or None if unknown
+    for marker, sheet in SHEETS.items():
+        if marker in file_name:
+            return sheet, marker in FIRST_SHEET_FALLBACK
+    return None
+
+# Dimension tables keep one row per ID
+DIMENSION_KEYS = {"study": "StudyID", "site": "SiteID", "subject": "SubjectID"}
+
+# Several exports describe the same Study/Site/Subject. Each attribute takes the first
+# non-null value in this order: EDC metrics is the system of record for subject/site
+# attributes, EDRR is the only source of OpenIssueCount, the rest only carry the ID.
+DIMENSION_PRECEDENCE = ["folder", "EDC_Metrics", "EDRR", "Missing_Pages", "Visit_Projection", "Lab_Discrepancies"]
+
+def source_rank(source_file):
+    for rank, kind in enumerate(DIMENSION_PRECEDENCE):
+        if kind in str(source_file):
+            return rank
+    return len(DIMENSION_PRECEDENCE)
+
+def upsert_dimension(df, key, source_files):
+    # Collapse candidate rows to one per key: rows are ranked by source precedence and
+    # groupby().first() takes the best non-null value per column (a hash aggregation).
+    # The surviving trace_id is the best-ranked row's; every contributing row keeps its
+    # own trace in provenance. Output keeps first-arrival order.
+    if df.empty:
+        return df
+    source_files = pd.Series(source_files, index=df.index)
+    ranks = source_files.map({f: source_rank(f) for f in source_files.unique()})
+    keyed = df[key].notna()
+    ranked = df[keyed].assign(_rank=ranks[keyed]).sort_values('_rank', kind='stable')
+    merged = ranked.groupby(key, sort=False).first().drop(columns='_rank')
+    arrival = df.loc[keyed, key].drop_duplicates()
+    merged = merged.reindex(arrival).reset_index()[df.columns]
+    return pd.concat([merged, df[~keyed]], ignore_index=True) if (~keyed).any() else merged
+
+def candidates_table(name):
+    # Every source row that offered a value for dimension `name`, tagged with its source_file.
+    # Saved next to the resolved table so an incremental re-ingest can re-rank all sources.
+    return f"{name}_candidates"
+
+def resolve_dimension(name, candidates):
+    return upsert_dimension(candidates.drop(columns='source_file'), DIMENSION_KEYS[name], candidates['source_file'])
+
+def load_canonical_tables(canonical_dir=CANONICAL_DIR):
+    tables = {}
+    for p_path in Path(canonical_dir).glob("*.parquet"):
+        tables[p_path.stem] = read_table(p_path, p_path.stem)
+    return tables
+
+def merge_file_tables(existing, new, study_id, source_file):
+    # Replace everything a previous version of (study_id, source_file) contributed with the
+    # freshly parsed rows. Rows are matched through their provenance trace_ids. Dimensions
+    # are re-resolved from their candidate rows, so a re-ingested file that loses on
+    # precedence for some keys still updates the columns only it provides.
+    prov = existing.get('provenance', pd.DataFrame())
+    stale = set()
+    if not prov.empty:
+        stale = set(prov.loc[(prov['study_id'] == study_id) & (prov['source_file'] == source_file), 'trace_id'])
+
+    merged = {}
+    for name in set(existing) | set(new):
+        if name in DIMENSION_KEYS and (candidates_table(name) in existing or name not in existing):
+            continue    # resolved from the merged candidates below
+        old = existing.get(name, pd.DataFrame())
+        if stale and 'trace_id' in old.columns:
+            old = old[~old['trace_id'].isin(stale)]
+        parts = [df for df in (old, new.get(name)) if df is not None and not df.empty]
+        if not parts:
+            continue
+        df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        if name in DIMENSION_KEYS:
+            # Canonical folder written before candidate tables existed: only the resolved rows are known
+            sources = pd.concat([p for p in (prov, new.get('provenance')) if p is not None and not p.empty])
+            sources = sources.drop_duplicates(subset='trace_id').set_index('trace_id')['source_file']
+            df = upsert_dimension(df, DIMENSION_KEYS[name], df['trace_id'].map(sources))
+        elif name == 'provenance':
+            df = df.drop_duplicates(subset='trace_id', keep='first')
+        elif name.endswith('_candidates'):
+            # The Study row registered from the folder comes back with every ingested file
+            df = df.drop_duplicates(subset='trace_id', keep='last')
+        merged[name] = df.reset_index(drop=True)
+
+    for name in DIMENSION_KEYS:
+        candidates = merged.get(candidates_table(name))
+        if name not in merged and candidates is not None:
+            merged[name] = resolve_dimension(name, candidates).reset_index(drop=True)
+    return merged
+
+def scan_source_files(source_dir):
+    # path -> (size, mtime_ns) for every workbook; Excel lock files (~$...) are ignored
+    found = {}
+    for pattern in ("*/*.xlsx", "*/*.parquet"):
+        for f in Path(source_dir).glob(pattern):
+            if f.name.startswith("~$") or "Study_" not in f.parent.name:
+                continue
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            found[f] = (st.st_size, st.st_mtime_ns)
+    return found
 
 class ProvenanceTracker:
-    def __init__(self):
+    def __init__(self, output_dir=CANONICAL_DIR):
+        self.output_dir = Path(output_dir)
         self.rows = []
 
     def add_trace(self, study_id, source_file, source_row, entity_type, entity_id):
@@ -59,23 +204,30 @@ class ProvenanceTracker:
             'source_row_number': source_row,
             'canonical_entity': entity_type,
             'entity_id': str(entity_id),
-            'ingestion_timestamp': datetime.datetime.now().isoformat()
+            'ingestion_timestamp': datetime.datetime.now()
         })
         return trace_id
 
-    def save(self):
+    def to_frame(self):
+        return apply_schema('provenance', pd.DataFrame(self.rows))
+
+    @timed()
+    def save(self, df=None):
         if not self.rows:
             return
-        df = pd.DataFrame(self.rows)
+        if df is None:
+            df = self.to_frame()
         # Append mode if file exists (optional, but overwriting for this phase)
         try:
-            df.to_parquet(CANONICAL_DIR / "provenance.parquet", index=False)
-            df.to_csv(CANONICAL_DIR / "provenance.csv", index=False)
+            df = apply_schema('provenance', df)
+            write_table(df, self.output_dir / "provenance.parquet", 'provenance')
+            df.to_csv(self.output_dir / "provenance.csv", index=False)
         except Exception as e:
             logging.error(f"Failed to save provenance: {e}")
 
 class CanonicalStore:
-    def __init__(self):
+    def __init__(self, output_dir=CANONICAL_DIR):
+        self.output_dir = Path(output_dir)
         self.data = {
             "Study": [],
             "Site": [],
@@ -88,49 +240,84 @@ class CanonicalStore:
             "Safety": [], # SAEEvent
             "Inactivation": [] # InactivationEvent
         }
-        self.seen_ids = {
-            "Study": set(),
-            "Site": set(),
-            "Subject": set()
-        }
+        # Dimensional entities (Study, Site, Subject) collect every candidate row and
+        # are resolved per study by upsert_dimension() instead of first-seen-wins
+        self.sources = {"Study": [], "Site": [], "Subject": []}
+        self.dimension_frames = {"Study": [], "Site": [], "Subject": []}
+        self.candidate_frames = {"Study": [], "Site": [], "Subject": []}
+        self.current_source = None   # file being parsed, set by IngestionEngine.route_file
 
     def add_entity(self, entity_type, data, trace_id):
         # Attach trace_id
         data['trace_id'] = trace_id
         
-        # Deduplication for dimensional entities (Study, Site, Subject)
-        if entity_type in ["Study", "Site", "Subject"]:
-            # Create a unique key for dedupe
-            key_field = f"{entity_type}ID"
-            obj_id = data.get(key_field)
-            if obj_id:
-                if obj_id in self.seen_ids[entity_type]:
-                    return # Skip duplicate
-                self.seen_ids[entity_type].add(obj_id)
+        if entity_type in self.sources:
+            self.sources[entity_type].append(self.current_source)
         
         self.data[entity_type].append(data)
 
-    def save_all(self):
-        print("\nSaving canonical tables...")
-        for entity_type, rows in self.data.items():
+    def flush_dimensions(self):
+        # Collapse the pending dimension rows (one study's worth) into frames
+        for entity_type, sources in self.sources.items():
+            rows = self.data[entity_type]
             if not rows:
                 continue
-            df = pd.DataFrame(rows)
-            # Enforce schema types (basic)
-            dest_file_parquet = CANONICAL_DIR / f"{entity_type.lower()}.parquet"
-            dest_file_csv = CANONICAL_DIR / f"{entity_type.lower()}.csv"
+            df = pd.DataFrame(rows).assign(source_file=sources)
+            self.candidate_frames[entity_type].append(df)
+            self.dimension_frames[entity_type].append(resolve_dimension(entity_type.lower(), df))
+            self.data[entity_type] = []
+            self.sources[entity_type] = []
+
+    def to_frames(self):
+        # Keyed by lower-case entity name, the same names the parquet files use
+        self.flush_dimensions()
+        frames = {}
+        for entity_type, rows in self.data.items():
+            parts = self.dimension_frames.get(entity_type)
+            if parts:
+                # IDs are study-prefixed, so the per-study frames don't overlap
+                df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+            elif rows:
+                df = pd.DataFrame(rows)
+            else:
+                continue
+            frames[entity_type.lower()] = apply_schema(entity_type.lower(), df)
+        for entity_type, parts in self.candidate_frames.items():
+            if parts:
+                frames[candidates_table(entity_type.lower())] = pd.concat(parts, ignore_index=True)
+        return frames
+
+    @timed()
+    def save_all(self, frames=None):
+        print("\nSaving canonical tables...")
+        if frames is None:
+            frames = self.to_frames()
+        for name, df in frames.items():
+            # Enforce schema types (categoricals / timestamps, see pipeline/schema.py)
+            df = apply_schema(name, df)
+            dest_file_parquet = self.output_dir / f"{name}.parquet"
+            dest_file_csv = self.output_dir / f"{name}.csv"
             
             try:
-                df.to_parquet(dest_file_parquet, index=False)
+                write_table(df, dest_file_parquet, name)
                 df.to_csv(dest_file_csv, index=False)
-                logging.info(f"Saved {len(rows)} rows to {dest_file_parquet}")
+                logging.info(f"Saved {len(df)} rows to {dest_file_parquet}")
             except Exception as e:
-                logging.error(f"Failed to save {entity_type}: {e}")
+                logging.error(f"Failed to save {name}: {e}")
 
 class IngestionEngine:
-    def __init__(self):
-        self.provenance = ProvenanceTracker()
-        self.store = CanonicalStore()
+    def __init__(self, source_dir=SOURCE_DIR, canonical_dir=CANONICAL_DIR, prefetch=2, schema_path=SCHEMA_PATH):
+        self.source_dir = Path(source_dir)
+        self.canonical_dir = Path(canonical_dir)
+        self.schema_path = Path(schema_path)    # validators are compiled on the first validate_row
+        self.quarantine_dir = self.canonical_dir / "Quarantine"
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        self.provenance = ProvenanceTracker(self.canonical_dir)
+        self.store = CanonicalStore(self.canonical_dir)
+        # Workbooks decoded ahead of the parser by process_study (0 = read inline)
+        self.prefetch = prefetch
+        self.prefetched = {}    # file_path -> (sheet_name, fallback, Future[DataFrame])
+        self.validation = [0.0, 0]  # seconds, rows validated in the file being parsed
         
     def normalize_date(self, date_str):
         if pd.isna(date_str):
@@ -150,9 +337,18 @@ class IngestionEngine:
             return None
 
     def validate_row(self, entity_type, row, source_info):
+        # Timed per batch, not per row: parse_file reports a whole file's validation at once
+        start = time.perf_counter()
+        try:
+            return self.check_row(entity_type, row, source_info)
+        finally:
+            self.validation[0] += time.perf_counter() - start
+            self.validation[1] += 1
+
+    def check_row(self, entity_type, row, source_info):
         # Get schema definition key
         def_key = entity_type.replace("Event", "") 
-        validator = VALIDATORS.get(def_key)
+        validator = compile_validators(self.schema_path).get(def_key)
         
         if not validator:
             logging.warning(f"No schema found for {entity_type}")
@@ -170,25 +366,97 @@ class IngestionEngine:
             
             validator.validate(row)
             return True
-        except ValidationError as e:
+        except jsonschema.ValidationError as e:
             # Quarantine
-            q_file = QUARANTINE_DIR / f"{source_info['study']}_{entity_type}_invalid.csv"
+            q_file = self.quarantine_file(source_info['study'], source_info['file'], entity_type)
+            METRICS.count(f"quarantined.{entity_type}")
             row['error'] = e.message
             row_df = pd.DataFrame([row])
             header = not q_file.exists()
             row_df.to_csv(q_file, mode='a', header=header, index=False)
             return False
 
+    def quarantine_file(self, study_id, file_name, entity_type):
+        # One file per source workbook and entity, so a re-parsed workbook only replaces its own rows
+        return self.quarantine_dir / f"{study_id}_{Path(file_name).stem}_{entity_type}_invalid.csv"
+
+    def clear_quarantine(self, study_id, file_name):
+        # Drop the rows an earlier parse of this workbook quarantined (entity names have no '_',
+        # which keeps e.g. Study_1_EDRR from matching Study_1_EDRR_v2's files)
+        prefix = f"{study_id}_{Path(file_name).stem}_"
+        for q_file in self.quarantine_dir.glob(f"{glob.escape(prefix)}*_invalid.csv"):
+            if "_" not in q_file.name[len(prefix):-len("_invalid.csv")]:
+                q_file.unlink()
+
+    def load_sheet(self, file_path, sheet_name, fallback=False):
+        # Decode one sheet into a DataFrame. Runs on the reader threads when prefetching.
+        with METRICS.timer("IngestionEngine.read_sheet"):
+            if file_path.suffix == ".parquet":
+                # Parquet equivalents (e.g. synthetic benchmark data) hold only the sheet the parser reads
+                df = pd.read_parquet(file_path)
+            elif fallback:
+                with pd.ExcelFile(file_path) as xl:
+                    df = xl.parse(sheet_name if sheet_name in xl.sheet_names else xl.sheet_names[0])
+            else:
+                df = pd.read_excel(file_path, sheet_name=sheet_name)
+        METRICS.count('rows_read', len(df))
+        return df
+
+    def read_sheet(self, file_path, sheet_name, fallback=False):
+        # Take the prefetched frame if process_study already queued this sheet, else read inline
+        queued = self.prefetched.pop(file_path, None)
+        if queued is not None and queued[:2] == (sheet_name, fallback):
+            with METRICS.timer("IngestionEngine.read_wait"):
+                return queued[2].result()
+        return self.load_sheet(file_path, sheet_name, fallback)
+
+    def iter_prefetched(self, files, pool):
+        # Yield files in order while up to `prefetch` upcoming sheets decode on `pool`.
+        # The window is the backpressure: at most prefetch + 1 decoded frames are held.
+        upcoming = iter(files)
+        window = deque()
+
+        def submit_next():
+            for file_path in upcoming:
+                spec = sheet_for(file_path.name)
+                future = pool.submit(self.load_sheet, file_path, *spec) if spec else None
+                window.append((file_path, spec, future))
+                return
+
+        for _ in range(self.prefetch):
+            submit_next()
+        while window:
+            file_path, spec, future = window.popleft()
+            submit_next()
+            if future is not None:
+                self.prefetched[file_path] = (*spec, future)
+            try:
+                yield file_path
+            finally:
+                self.prefetched.pop(file_path, None)
+
+    @timed()
     def process_study(self, study_folder):
         study_id = study_folder.split('_')[1] # Study_1_Input_Files -> 1
         logging.info(f"Starting ingestion for Study {study_id}")
         
-        files = list((SOURCE_DIR / study_folder).glob("*.xlsx"))
+        folder = self.source_dir / study_folder
+        files = list(folder.glob("*.xlsx")) + list(folder.glob("*.parquet"))
         
         # Register Study Entity
+        self.store.current_source = "folder"
         self.store.add_entity("Study", {"StudyID": f"Study {study_id}"}, 
                               self.provenance.add_trace(study_id, "folder", 0, "Study", f"Study {study_id}"))
 
+        if self.prefetch > 0:
+            with ThreadPoolExecutor(max_workers=self.prefetch, thread_name_prefix="sheet-reader") as pool:
+                self.parse_files(study_id, self.iter_prefetched(files, pool))
+        else:
+            self.parse_files(study_id, files)
+
+        self.store.flush_dimensions()
+
+    def parse_files(self, study_id, files):
         for file_path in files:
             try:
                 self.parse_file(study_id, file_path)
@@ -196,8 +464,20 @@ class IngestionEngine:
                 logging.error(f"Failed parsing file {file_path.name}: {e}")
 
     def parse_file(self, study_id, file_path):
+        self.validation = [0.0, 0]
+        self.clear_quarantine(study_id, file_path.name)
+        try:
+            self.route_file(study_id, file_path)
+        finally:
+            seconds, rows = self.validation
+            if rows:
+                METRICS.add_time("IngestionEngine.validate_batch", seconds)
+                METRICS.count('rows_validated', rows)
+
+    def route_file(self, study_id, file_path):
         fname = file_path.name
         logging.info(f"  Parsing {fname}...")
+        self.store.current_source = fname
         
         # Identify file type
         if "EDC_Metrics" in fname:
@@ -221,9 +501,10 @@ class IngestionEngine:
         else:
             logging.warning(f"Unknown file type: {fname}")
 
+    @timed()
     def parse_edc_metrics(self, study_id, file_path):
         try:
-            df = pd.read_excel(file_path, sheet_name="Query Report - Cumulative")
+            df = self.read_sheet(file_path, SHEETS["EDC_Metrics"])
         except:
             logging.warning(f"Sheet 'Query Report - Cumulative' not found in {file_path}")
             return
@@ -281,9 +562,10 @@ class IngestionEngine:
                 t_id = self.provenance.add_trace(study_id, file_path.name, idx, "Query", q_id)
                 self.store.add_entity("Query", query_data, t_id)
 
+    @timed()
     def parse_missing_pages(self, study_id, file_path):
         try:
-            df = pd.read_excel(file_path, sheet_name="All Pages Missing")
+            df = self.read_sheet(file_path, SHEETS["Missing_Pages"])
         except: return
 
         for idx, row in df.iterrows():
@@ -303,9 +585,10 @@ class IngestionEngine:
                  t_id = self.provenance.add_trace(study_id, file_path.name, idx, "Form", form_data['FormName'])
                  self.store.add_entity("Form", form_data, t_id)
 
+    @timed()
     def parse_lab(self, study_id, file_path):
         try:
-             df = pd.read_excel(file_path, sheet_name="Missing_Lab_Name_and_Missing")
+             df = self.read_sheet(file_path, SHEETS["Lab_Discrepancies"])
         except: return
 
         for idx, row in df.iterrows():
@@ -326,9 +609,10 @@ class IngestionEngine:
                  t_id = self.provenance.add_trace(study_id, file_path.name, idx, "Lab", str(idx))
                  self.store.add_entity("Lab", lab_data, t_id)
 
+    @timed()
     def parse_sae(self, study_id, file_path):
         try:
-            df = pd.read_excel(file_path, sheet_name="SAE Dashboard_Safety")
+            df = self.read_sheet(file_path, SHEETS["SAE_Dashboard"])
         except: return
         
         for idx, row in df.iterrows():
@@ -342,12 +626,10 @@ class IngestionEngine:
                  t_id = self.provenance.add_trace(study_id, file_path.name, idx, "Safety", sae_data['CaseID'])
                  self.store.add_entity("Safety", sae_data, t_id)
 
+    @timed()
     def parse_coding(self, study_id, file_path, dict_type):
-        sheet = "GlobalCodingReport_MedDRA" if dict_type == "MedDRA" else "GlobalCodingReport_WHODD"
         try:
-            xl = pd.ExcelFile(file_path)
-            sheet_name = sheet if sheet in xl.sheet_names else xl.sheet_names[0]
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
+            df = self.read_sheet(file_path, SHEETS[dict_type], fallback=True)
         except: return
 
         for idx, row in df.iterrows():
@@ -361,9 +643,10 @@ class IngestionEngine:
                 t_id = self.provenance.add_trace(study_id, file_path.name, idx, "Coding", str(idx))
                 self.store.add_entity("Coding", coding_data, t_id)
     
+    @timed()
     def parse_edrr(self, study_id, file_path):
         try:
-            df = pd.read_excel(file_path, sheet_name="OpenIssuesSummary")
+            df = self.read_sheet(file_path, SHEETS["EDRR"])
         except: return
         
         for idx, row in df.iterrows():
@@ -378,9 +661,10 @@ class IngestionEngine:
                      t_id = self.provenance.add_trace(study_id, file_path.name, idx, "Subject", subj_id)
                      self.store.add_entity("Subject", subj_data, t_id)
 
+    @timed()
     def parse_visit_projection(self, study_id, file_path):
         try:
-            df = pd.read_excel(file_path, sheet_name="Missing Visits")
+            df = self.read_sheet(file_path, SHEETS["Visit_Projection"])
         except: return
         for idx, row in df.iterrows():
             if row.get('Subject'):
@@ -399,9 +683,10 @@ class IngestionEngine:
                 t_id = self.provenance.add_trace(study_id, file_path.name, idx, "Visit", visit_data['VisitName'])
                 self.store.add_entity("Visit", visit_data, t_id)
 
+    @timed()
     def parse_inactivated(self, study_id, file_path):
         try:
-             df = pd.read_excel(file_path, sheet_name=0) 
+             df = self.read_sheet(file_path, SHEETS["Inactivated_Records"]) 
         except: return
         for idx, row in df.iterrows():
             inact_data = {
@@ -414,37 +699,168 @@ class IngestionEngine:
                 t_id = self.provenance.add_trace(study_id, file_path.name, idx, "Inactivation", str(idx))
                 self.store.add_entity("Inactivation", inact_data, t_id)
 
+    def run(self):
+        # Quarantine rows are appended file by file, so clear the previous run's files first
+        for q_file in self.quarantine_dir.glob("*_invalid.csv"):
+            q_file.unlink()
+
+        study_folders = sorted([d.name for d in self.source_dir.iterdir() if d.is_dir() and "Study_" in d.name])
+        
+        registry_rows = []
+        
+        for folder in study_folders:
+            try:
+                self.process_study(folder)
+                registry_rows.append({"study_folder": folder, "status": "ingested", "timestamp": datetime.datetime.now()})
+            except Exception as e:
+                logging.error(f"Failed study {folder}: {e}")
+                registry_rows.append({"study_folder": folder, "status": "failed", "error": str(e)})
+
+        # Save Registry
+        pd.DataFrame(registry_rows).to_csv(self.canonical_dir / "study_registry.csv", index=False)
+
+        # Build the frames once: they are written to disk and handed to Phase 3 when run in-process
+        tables = self.store.to_frames()
+        tables['provenance'] = self.provenance.to_frame()
+        # Storage order, applied before the index is built so row positions match the files
+        tables = cluster_by_subject(tables)
+
+        # Save All Entities
+        self.store.save_all({k: v for k, v in tables.items() if k != 'provenance'})
+        
+        # Save Provenance
+        self.provenance.save(tables['provenance'])
+
+        # Subject drill-down index (CSR offsets from each SubjectID into the entity tables)
+        build_subject_index(tables, self.canonical_dir / INDEX_FILE)
+
+        return tables
+
+    @timed()
+    def ingest_file(self, file_path, existing=None):
+        # Incremental path used by watch mode: parse one workbook and splice its rows
+        # into the canonical tables on disk (or `existing`, if already loaded).
+        file_path = Path(file_path)
+        study_id = file_path.parent.name.split('_')[1]
+        self.store.current_source = "folder"
+        self.store.add_entity("Study", {"StudyID": f"Study {study_id}"},
+                              self.provenance.add_trace(study_id, "folder", 0, "Study", f"Study {study_id}"))
+        self.parse_file(study_id, file_path)
+
+        new_tables = self.store.to_frames()
+        new_tables['provenance'] = self.provenance.to_frame()
+        if existing is None:
+            existing = load_canonical_tables(self.canonical_dir)
+        tables = cluster_by_subject(merge_file_tables(existing, new_tables, study_id, file_path.name))
+
+        # Only rewrite the tables this file touched
+        changed = {
+            k: v for k, v in tables.items()
+            if k != 'provenance' and (k in new_tables or len(v) != len(existing.get(k, ())))
+        }
+        self.store.save_all(changed)
+        self.provenance.save(tables['provenance'])
+        build_subject_index(tables, self.canonical_dir / INDEX_FILE)
+        logging.info(f"Merged {file_path.name} into canonical tables (Study {study_id})")
+        return study_id, tables
+
+
+def refresh_downstream(study_ids, tables, config):
+    # Re-run Phase 3 for the touched studies only, then re-aggregate Phase 4 from the
+    # in-memory signals (the DQI groupby is cheap next to signal generation)
+    from Phase_3_Risk_Signals import compute_signals
+    from Phase_4_Aggregation import compute_dqi
+
+    signals = traces = None
+    for study_id in sorted(study_ids):
+        signals, traces = compute_signals.refresh_study(study_id, tables, signals=signals, traces=traces,
+                                                        output_dir=config.signal_dir)
+    if signals is not None and not signals.empty:
+        compute_dqi.DQIEngine(signals=signals, signal_file=config.signal_dir / "signals.parquet",
+                              output_dir=config.dqi_dir, config_file=config.weights_file).run()
+
+def refresh_previews(config):
+    # Files view index: only the new upload and the rewritten outputs are read again
+    from pipeline.previews import PreviewIndex
+    PreviewIndex(config).run()
+
+def watch(config=None, interval=2.0, debounce=5.0, refresh=True):
+    # Poll the study folders and ingest any workbook that is new or changed once its
+    # size/mtime have been stable for `debounce` seconds (sites copy large files slowly).
+    # Sources, canonical tables, signal/DQI outputs and previews all come from `config`.
+    config = config or PipelineConfig(BASE_DIR)
+    source_dir = config.source_dir
+    logging.info(f"Watching {source_dir} (poll every {interval}s, debounce {debounce}s)")
+    known = scan_source_files(source_dir)   # current files are assumed to be ingested already
+    pending = {}                            # path -> (stat, time the stat was first seen)
+    tables = None
+
+    while True:
+        now = time.monotonic()
+        ready = []
+        for path, stat in scan_source_files(source_dir).items():
+            if known.get(path) == stat:
+                pending.pop(path, None)
+            elif path not in pending or pending[path][0] != stat:
+                pending[path] = (stat, now)
+            elif now - pending[path][1] >= debounce:
+                ready.append(path)
+
+        touched = set()
+        for path in sorted(ready):
+            stat = pending.pop(path)[0]
+            try:
+                engine = IngestionEngine(source_dir=config.source_dir, canonical_dir=config.canonical_dir,
+                                         schema_path=config.schema_file)
+                study_id, tables = engine.ingest_file(path, existing=tables)
+                touched.add(study_id)
+            except Exception as e:
+                logging.error(f"Failed ingesting {path.name}: {e}")
+            known[path] = stat
+
+        if touched and refresh:
+            try:
+                refresh_downstream(touched, tables, config)
+            except Exception as e:
+                logging.error(f"Failed refreshing signals/DQI for studies {sorted(touched)}: {e}")
+            try:
+                refresh_previews(config)
+            except Exception as e:
+                logging.error(f"Failed refreshing file previews: {e}")
+
+        time.sleep(interval)
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Phase 2: ingest standardized study files into canonical tables")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and ingest new/changed workbooks as they land")
+    parser.add_argument("--interval", type=float, default=2.0, help="Watch mode: seconds between folder scans")
+    parser.add_argument("--debounce", type=float, default=5.0,
+                        help="Watch mode: seconds a file must be unchanged before it is ingested")
+    parser.add_argument("--no-refresh", action="store_true",
+                        help="Watch mode: only update canonical tables, skip the signal/DQI refresh")
+    parser.add_argument("--prefetch", type=int, default=2,
+                        help="Workbooks decoded ahead of the parser on reader threads (0 = read one at a time)")
+    args = parser.parse_args()
+    setup_logging()
+
     if not SOURCE_DIR.exists():
         logging.error(f"Source dir {SOURCE_DIR} not found.")
         return
 
-    # Filter for processing specific studies if stuck
-    # But for now, just process what is there.
-    
-    engine = IngestionEngine()
-    
-    study_folders = sorted([d.name for d in SOURCE_DIR.iterdir() if d.is_dir() and "Study_" in d.name])
-    
-    registry_rows = []
-    
-    for folder in study_folders:
+    if args.watch:
         try:
-            engine.process_study(folder)
-            registry_rows.append({"study_folder": folder, "status": "ingested", "timestamp": datetime.datetime.now()})
-        except Exception as e:
-            logging.error(f"Failed study {folder}: {e}")
-            registry_rows.append({"study_folder": folder, "status": "failed", "error": str(e)})
-
-    # Save Registry
-    pd.DataFrame(registry_rows).to_csv(CANONICAL_DIR / "study_registry.csv", index=False)
+            watch(interval=args.interval, debounce=args.debounce, refresh=not args.no_refresh)
+        except KeyboardInterrupt:
+            logging.info("Watch mode stopped.")
+        return
 
-    # Save All Entities
-    engine.store.save_all()
+    # Filter for processing specific studies if stuck
+    # But for now, just process what is there.
     
-    # Save Provenance
-    engine.provenance.save()
+    engine = IngestionEngine(prefetch=args.prefetch)
+    engine.run()
 
     print("Phase 2 Ingestion Complete.")
 
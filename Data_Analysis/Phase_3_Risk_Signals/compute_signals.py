@@ -1,30 +1,52 @@
 import os
-import pandas as pd
-import numpy as np
+import sys
 import uuid
 import datetime
 from pathlib import Path
 
+if not __package__:
+    # `python Phase_3_Risk_Signals/compute_signals.py`: only the script's own folder is on sys.path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline.lazy import lazy_import
+from pipeline.metrics import METRICS, timed
+from pipeline.schema import (SIGNAL_TRACES_FILE, TRACE_COLUMNS, TRACE_ROW_GROUP, apply_schema,
+                             read_signals, read_table, sort_table, write_table)
+from pipeline.subject_store import SIGNAL_INDEX_FILE, build_signal_index
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
 # Configuration
-BASE_DIR = Path("/Users/mypro16/Desktop/Novaratis/Data for problem Statement 1")
+# Paths resolve relative to the Data_Analysis folder unless PIPELINE_BASE_DIR overrides them
+BASE_DIR = Path(os.environ.get("PIPELINE_BASE_DIR", Path(__file__).resolve().parent.parent))
 CANONICAL_DIR = BASE_DIR / "Phase_2_Ingestion/Canonical_Data"
 OUTPUT_DIR = BASE_DIR / "Phase_3_Risk_Signals/Signal_Data"
 
-# Ensure output directory
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+ENTITIES = ['study', 'site', 'subject', 'visit', 'form', 'query', 'lab', 'safety', 'coding', 'inactivation', 'provenance']
 
 class SignalEngine:
-    def __init__(self):
+    def __init__(self, tables=None, canonical_dir=CANONICAL_DIR, output_dir=OUTPUT_DIR):
+        self.canonical_dir = Path(canonical_dir)
+        self.output_dir = Path(output_dir)
         self.signals = []
-        self.load_data()
+        self.traces = []        # (signal_id, trace_id) edges
+        self.signal_ids = set()
+        self.trace_frame = pd.DataFrame(columns=TRACE_COLUMNS)
+        if tables is not None:
+            # In-process hand-off from Phase 2: no need to re-read the parquet files
+            self.dfs = {entity: tables.get(entity, pd.DataFrame()) for entity in ENTITIES}
+        else:
+            self.load_data()
+        METRICS.count('rows_read', sum(len(df) for df in self.dfs.values()))
 
+    @timed()
     def load_data(self):
         print("Loading canonical data...")
         self.dfs = {}
-        for entity in ['study', 'site', 'subject', 'visit', 'form', 'query', 'lab', 'safety', 'coding', 'inactivation', 'provenance']:
-            p_path = CANONICAL_DIR / f"{entity}.parquet"
+        for entity in ENTITIES:
+            p_path = self.canonical_dir / f"{entity}.parquet"
             if p_path.exists():
-                self.dfs[entity] = pd.read_parquet(p_path)
+                self.dfs[entity] = read_table(p_path, entity)
             else:
                 print(f"Warning: {entity} data not found.")
                 self.dfs[entity] = pd.DataFrame()
@@ -38,9 +60,19 @@ class SignalEngine:
         if score >= 0.2: return "Medium"
         return "Low"
 
+    def new_signal_id(self):
+        # Short ids stay readable; re-draw on collision so the edge table stays unambiguous
+        while True:
+            signal_id = str(uuid.uuid4())[:8]
+            if signal_id not in self.signal_ids:
+                self.signal_ids.add(signal_id)
+                return signal_id
+
     def add_signal(self, name, domain, entity_type, entity_id, study_id, raw_val, norm_score, explanation, trace_ids):
+        signal_id = self.new_signal_id()
+        self.traces.extend((signal_id, t) for t in trace_ids)
         self.signals.append({
-            "signal_id": str(uuid.uuid4())[:8],
+            "signal_id": signal_id,
             "signal_name": name,
             "domain": domain,
             "entity_type": entity_type,
@@ -50,8 +82,7 @@ class SignalEngine:
             "normalized_score": round(norm_score, 4),
             "severity_level": self.get_severity(norm_score),
             "explanation": explanation,
-            "trace_ids": trace_ids, # Keep as list
-            "signal_timestamp": datetime.datetime.now().isoformat()
+            "signal_timestamp": datetime.datetime.now()
         })
 
     def run_all(self):
@@ -60,9 +91,12 @@ class SignalEngine:
         self.domain_3_queries()
         self.domain_4_labs()
         self.domain_5_safety_coding()
-        self.save()
+        df = self.save()
+        build_signal_index(df, self.trace_frame, self.dfs['provenance'], self.output_dir / SIGNAL_INDEX_FILE)
+        return df
 
     # --- DOMAIN 1: EDC DATA COMPLETENESS ---
+    @timed()
     def domain_1_edc(self):
         print("Running Domain 1: EDC Completeness...")
         
@@ -170,6 +204,7 @@ class SignalEngine:
                 )
 
     # --- DOMAIN 2: VISIT COMPLIANCE ---
+    @timed()
     def domain_2_visits(self):
         print("Running Domain 2: Visits...")
         visits = self.dfs.get('visit')
@@ -209,6 +244,7 @@ class SignalEngine:
                 )
 
     # --- DOMAIN 3: QUERIES ---
+    @timed()
     def domain_3_queries(self):
         print("Running Domain 3: Queries...")
         queries = self.dfs.get('query')
@@ -249,6 +285,7 @@ class SignalEngine:
                 )
 
     # --- DOMAIN 4: LABS ---
+    @timed()
     def domain_4_labs(self):
         print("Running Domain 4: Labs...")
         labs = self.dfs.get('lab')
@@ -276,6 +313,7 @@ class SignalEngine:
             )
 
     # --- DOMAIN 5: SAFETY ---
+    @timed()
     def domain_5_safety_coding(self):
         print("Running Domain 5: Safety/Coding...")
         
@@ -326,27 +364,70 @@ class SignalEngine:
                     trace_ids=[row['trace_id']]
                 )
 
-    def save(self):
-        print(f"Saving {len(self.signals)} signals...")
-        if not self.signals:
-            print("No signals generated.")
-            return
+    @timed()
+    def save(self, df=None, traces=None):
+        if df is None:
+            if not self.signals:
+                print("No signals generated.")
+                return pd.DataFrame()
+            df = pd.DataFrame(self.signals)
+            traces = pd.DataFrame(self.traces, columns=TRACE_COLUMNS)
+        print(f"Saving {len(df)} signals...")
+        # Stored sorted by (study_id, domain, entity_type, entity_id); the returned frame
+        # has the same order, so row positions in the subject index match the dataset
+        df = sort_table('signals', apply_schema('signals', df))
+        traces = traces.sort_values('signal_id', kind='stable', ignore_index=True)
+        self.trace_frame = traces
 
-        df = pd.DataFrame(self.signals)
-        
-        # Convert trace_ids list to string for CSV compatibility (Parquet can handle lists)
-        # We will save parquet as primary
-        
-        out_parquet = OUTPUT_DIR / "signals.parquet"
-        out_csv = OUTPUT_DIR / "signals.csv"
+        os.makedirs(self.output_dir, exist_ok=True)
         
-        df.to_parquet(out_parquet, index=False)
-        
-        # For CSV, join explainability
-        df_csv = df.copy()
-        df_csv['trace_ids'] = df_csv['trace_ids'].apply(lambda x: '|'.join(x))
-        df_csv.to_csv(out_csv, index=False)
+        # Both tables are scalar-only, so Parquet and CSV are written column-wise
+        write_table(df, self.output_dir / "signals.parquet", 'signals')
+        write_table(traces, self.output_dir / SIGNAL_TRACES_FILE, row_group_size=TRACE_ROW_GROUP)
+        df.to_csv(self.output_dir / "signals.csv", index=False)
+        traces.to_csv(self.output_dir / "signal_traces.csv", index=False)
         print("Done.")
+        return df
+
+def refresh_study(study_id, tables, signals=None, traces=None, output_dir=OUTPUT_DIR):
+    # Incremental refresh (watch mode): recompute the signals of one study from its
+    # slice of the canonical tables and swap them (and their trace edges) into
+    # signals.parquet / signal_traces.parquet. Returns the merged (signals, traces).
+    prov = tables.get('provenance', pd.DataFrame())
+    study_prov = prov[prov['study_id'] == study_id]
+    traces = set(study_prov['trace_id'])
+    subset = {
+        name: df[df['trace_id'].isin(traces)] if 'trace_id' in df.columns else df
+        for name, df in tables.items() if name != 'provenance'
+    }
+    subset['provenance'] = study_prov
+
+    engine = SignalEngine(tables=subset, output_dir=output_dir)
+    if signals is None:
+        out_parquet = engine.output_dir / "signals.parquet"
+        if out_parquet.exists():
+            signals, traces = read_signals(out_parquet)
+        else:
+            signals, traces = pd.DataFrame(), pd.DataFrame(columns=TRACE_COLUMNS)
+    if not signals.empty:
+        engine.signal_ids.update(signals['signal_id'])
+    engine.domain_1_edc()
+    engine.domain_2_visits()
+    engine.domain_3_queries()
+    engine.domain_4_labs()
+    engine.domain_5_safety_coding()
+
+    kept = signals[signals['study_id'] != study_id] if not signals.empty else signals
+    parts = [df for df in (kept, pd.DataFrame(engine.signals)) if not df.empty]
+    merged = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    print(f"Study {study_id}: {len(engine.signals)} signals refreshed.")
+    if merged.empty:
+        return merged, pd.DataFrame(columns=TRACE_COLUMNS)
+    kept_traces = traces[traces['signal_id'].isin(kept['signal_id'])] if not kept.empty else traces.iloc[:0]
+    merged_traces = pd.concat([kept_traces, pd.DataFrame(engine.traces, columns=TRACE_COLUMNS)], ignore_index=True)
+    merged = engine.save(merged, merged_traces)
+    build_signal_index(merged, engine.trace_frame, prov, engine.output_dir / SIGNAL_INDEX_FILE)
+    return merged, engine.trace_frame
 
 if __name__ == "__main__":
     engine = SignalEngine()
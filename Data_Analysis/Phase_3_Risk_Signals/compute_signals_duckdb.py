@@ -0,0 +1,284 @@
+import os
+import datetime
+import functools
+from pathlib import Path
+
+from pipeline.duckdb_backend import DEFAULT_MEMORY_LIMIT, column_types, connect, copy_partitioned, parquet, quote
+from pipeline.lazy import lazy_import
+from pipeline.metrics import METRICS, timed
+from pipeline.schema import CATEGORIES, SIGNAL_TRACES_FILE, TRACE_ROW_GROUP
+from pipeline.subject_store import SIGNAL_INDEX_FILE, csr, save_index
+
+from Phase_3_Risk_Signals.compute_signals import CANONICAL_DIR, ENTITIES, OUTPUT_DIR, SignalEngine
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+ROW_KEY = "study_id, source_file, source_row_number"
+# schema.sort_table order of the signals (partitions, sort keys, then generation order)
+SIGNAL_ORDER = "study_id, domain, entity_type, entity_id, signal_id"
+
+
+@functools.lru_cache(maxsize=None)
+def infer_string():
+    try:
+        return pd.get_option('future.infer_string')
+    except KeyError:  # pandas < 2.1
+        return False
+
+
+class DuckDBSignalEngine(SignalEngine):
+    # Out-of-core SignalEngine: every domain is one SQL query over the canonical Parquet
+    # files, appended to a DuckDB table that spills to disk past `memory_limit`. The rules
+    # mirror the pandas domain methods in compute_signals.py; keep the two in sync.
+    def __init__(self, canonical_dir=CANONICAL_DIR, output_dir=OUTPUT_DIR,
+                 memory_limit=DEFAULT_MEMORY_LIMIT, temp_dir=None, threads=None):
+        self.canonical_dir = Path(canonical_dir)
+        self.output_dir = Path(output_dir)
+        self.con = connect(memory_limit, temp_dir or self.output_dir / ".duckdb_tmp", threads)
+        self.today = pd.to_datetime('today')
+        self.seq = 0
+        self.load_data()
+        self.con.execute("""
+            CREATE TEMP TABLE signal_rows (
+                seq INTEGER, pos BIGINT, signal_name VARCHAR, domain VARCHAR, entity_type VARCHAR,
+                entity_id VARCHAR, study_id VARCHAR, raw_metric_value BIGINT, score DOUBLE,
+                explanation VARCHAR, trace_id VARCHAR)
+        """)
+
+    @timed()
+    def load_data(self):
+        print("Opening canonical data...")
+        self.columns = {}
+        for entity in ENTITIES:
+            p_path = self.canonical_dir / f"{entity}.parquet"
+            if p_path.exists():
+                self.con.execute(f"CREATE VIEW {entity} AS SELECT * FROM {parquet(p_path)}")
+                self.columns[entity] = column_types(self.con, entity)
+                METRICS.count('rows_read', self.con.execute(f"SELECT count(*) FROM {entity}").fetchone()[0])
+            else:
+                print(f"Warning: {entity} data not found.")
+
+    def has(self, *entities):
+        return all(e in self.columns for e in entities)
+
+    # --- SQL equivalents of the per-row Python conversions ---
+    def as_int(self, table, col, alias):
+        # int(row.get(col, 0)), with 0 wherever int() would raise
+        dtype = self.columns[table].get(col)
+        ref = f"{alias}.\"{col}\""
+        if dtype is None:
+            return "0"
+        if dtype in ('DOUBLE', 'FLOAT') or dtype.startswith('DECIMAL'):
+            return f"COALESCE(TRY_CAST(trunc({ref}) AS BIGINT), 0)"
+        if dtype == 'VARCHAR':
+            return (f"CASE WHEN regexp_full_match(trim({ref}), '[+-]?[0-9]+') "
+                    f"THEN TRY_CAST(trim({ref}) AS BIGINT) ELSE 0 END")
+        return f"COALESCE(TRY_CAST({ref} AS BIGINT), 0)"
+
+    def as_text(self, table, col, alias, missing='None'):
+        # f"{row.get(col)}": nulls read back as NaN in categorical columns (and in string
+        # columns when pandas infers its str dtype, the pandas 3 default), None otherwise
+        if col not in self.columns[table]:
+            return quote(missing)
+        nan_strings = self.columns[table][col] == 'VARCHAR' and infer_string()
+        null = 'nan' if col in CATEGORIES.get(table, []) or nan_strings else 'None'
+        return f"COALESCE(CAST({alias}.\"{col}\" AS VARCHAR), {quote(null)})"
+
+    @staticmethod
+    def norm(expr, max_val):
+        # normalize_score()
+        return f"least(greatest(({expr}) / {float(max_val)}, 0.0), 1.0)"
+
+    def subject_link(self, entity):
+        # Entity trace -> SubjectID defined on the same source row
+        return f"""
+            SELECT e.trace_id, e.study_id, s.entity_id AS subject_id
+            FROM provenance e JOIN provenance s USING ({ROW_KEY})
+            WHERE e.canonical_entity = {quote(entity)} AND s.canonical_entity = 'Subject'
+        """
+
+    def traces_of(self, entity):
+        return f"SELECT trace_id, study_id FROM provenance WHERE canonical_entity = {quote(entity)}"
+
+    def add_signals(self, name, domain, entity_type, query, params=()):
+        # `query` selects pos, entity_id, study_id, raw_val, score, explanation, trace_id
+        self.seq += 1
+        self.con.execute(f"""
+            INSERT INTO signal_rows
+            SELECT {self.seq}, pos, ?, ?, ?, entity_id, study_id, raw_val, score, explanation, trace_id
+            FROM ({query})
+        """, [name, domain, entity_type, *params])
+
+    # --- DOMAIN 1: EDC DATA COMPLETENESS ---
+    @timed()
+    def domain_1_edc(self):
+        print("Running Domain 1: EDC Completeness...")
+        if not self.has('form', 'provenance'):
+            return
+        days = self.as_int('form', 'DaysMissing', 'f')
+        self.add_signals("Overdue CRF / Missing Page", "EDC Completeness", "Subject", f"""
+            SELECT pos, entity_id, study_id, raw_val, {self.norm('raw_val', 60)} AS score,
+                   'Form ''' || form_name || ''' is missing for ' || raw_val || ' days.' AS explanation, trace_id
+            FROM (
+                SELECT f.file_row_number AS pos, l.subject_id AS entity_id, l.study_id, {days} AS raw_val,
+                       {self.as_text('form', 'FormName', 'f')} AS form_name, f.trace_id
+                FROM form f JOIN ({self.subject_link('Form')}) l USING (trace_id)
+                WHERE f.IsMissing = true
+            )
+        """)
+
+    # --- DOMAIN 2: VISIT COMPLIANCE ---
+    @timed()
+    def domain_2_visits(self):
+        print("Running Domain 2: Visits...")
+        if not self.has('visit', 'provenance'):
+            return
+        days = self.as_int('visit', 'DaysOutstanding', 'v')
+        self.add_signals("Visit Delay", "Visit Compliance", "Subject", f"""
+            SELECT pos, entity_id, study_id, raw_val, {self.norm('raw_val', 30)} AS score,
+                   'Visit ''' || visit_name || ''' is outstanding for ' || raw_val || ' days.' AS explanation, trace_id
+            FROM (
+                SELECT v.file_row_number AS pos, l.subject_id AS entity_id, l.study_id, {days} AS raw_val,
+                       {self.as_text('visit', 'VisitName', 'v')} AS visit_name, v.trace_id
+                FROM visit v JOIN ({self.subject_link('Visit')}) l USING (trace_id)
+            )
+            WHERE raw_val > 0
+        """)
+
+    # --- DOMAIN 3: QUERIES ---
+    @timed()
+    def domain_3_queries(self):
+        print("Running Domain 3: Queries...")
+        if not self.has('query', 'provenance'):
+            return
+        # (today - open_date).days, floored like timedelta.days; unparseable dates age 0
+        open_ts = "TRY_CAST(q.OpenDate AS TIMESTAMP)" if 'OpenDate' in self.columns['query'] else "NULL::TIMESTAMP"
+        age = f"COALESCE(CAST(floor((epoch_us(?::TIMESTAMP) - epoch_us({open_ts})) / 86400e6) AS BIGINT), 0)"
+        self.add_signals("Open Query Risk", "Query Health", "Query", f"""
+            SELECT pos, entity_id, study_id, raw_val, {self.norm('raw_val', 45)} AS score,
+                   'Query ' || query_id || ' has been open for ' || raw_val || ' days.' AS explanation, trace_id
+            FROM (
+                SELECT q.file_row_number AS pos, q.QueryID AS entity_id, p.study_id, {age} AS raw_val,
+                       {self.as_text('query', 'QueryID', 'q')} AS query_id, q.trace_id
+                FROM query q JOIN ({self.traces_of('Query')}) p USING (trace_id)
+                WHERE q.QueryStatus = 'Open'
+            )
+        """, [self.today.to_pydatetime()])
+
+    # --- DOMAIN 4: LABS ---
+    @timed()
+    def domain_4_labs(self):
+        print("Running Domain 4: Labs...")
+        if not self.has('lab', 'provenance'):
+            return
+        self.add_signals("Lab Data Issue", "Lab Integrity", "Lab", f"""
+            SELECT l.file_row_number AS pos,
+                   'Lab_' || (row_number() OVER (ORDER BY l.file_row_number) - 1) AS entity_id,
+                   p.study_id, 1 AS raw_val, 0.8 AS score,
+                   'Lab discrepancy found: ' || {self.as_text('lab', 'IssueType', 'l', missing='Unknown')} AS explanation,
+                   l.trace_id
+            FROM lab l JOIN ({self.traces_of('Lab')}) p USING (trace_id)
+        """)
+
+    # --- DOMAIN 5: SAFETY ---
+    @timed()
+    def domain_5_safety_coding(self):
+        print("Running Domain 5: Safety/Coding...")
+        if self.has('coding', 'provenance'):
+            status = "c.CodingStatus" if 'CodingStatus' in self.columns['coding'] else "NULL"
+            self.add_signals("Uncoded Term", "Coding Readiness", "Coding", f"""
+                SELECT * FROM (
+                    SELECT c.file_row_number AS pos,
+                           'Code_' || (row_number() OVER (ORDER BY c.file_row_number) - 1) AS entity_id,
+                           p.study_id, 1 AS raw_val, 0.6 AS score,
+                           'Term ''' || {self.as_text('coding', 'VerbatimTerm', 'c')} || ''' is not coded.' AS explanation,
+                           c.trace_id, {status} AS status
+                    FROM coding c JOIN ({self.traces_of('Coding')}) p USING (trace_id)
+                )
+                WHERE status IS DISTINCT FROM 'Coded'
+            """)
+
+        if self.has('safety', 'provenance'):
+            case_id = "s.CaseID" if 'CaseID' in self.columns['safety'] else "NULL"
+            self.add_signals("SAE Attention Required", "Safety", "SafetyCase", f"""
+                SELECT s.file_row_number AS pos, {case_id} AS entity_id, p.study_id, 1 AS raw_val, 0.5 AS score,
+                       'SAE Case ' || {self.as_text('safety', 'CaseID', 's')} || ' status: '
+                           || {self.as_text('safety', 'CaseStatus', 's')} AS explanation,
+                       s.trace_id
+                FROM safety s JOIN ({self.traces_of('Safety')}) p USING (trace_id)
+            """)
+
+    def run_all(self):
+        self.domain_1_edc()
+        self.domain_2_visits()
+        self.domain_3_queries()
+        self.domain_4_labs()
+        self.domain_5_safety_coding()
+        self.save()
+        # Nothing is materialized in pandas; downstream stages read the files
+        return None
+
+    @timed()
+    def save(self):
+        n = self.con.execute("SELECT count(*) FROM signal_rows").fetchone()[0]
+        if n == 0:
+            print("No signals generated.")
+            return
+        print(f"Saving {n} signals...")
+        # Sequential 8-hex-digit ids: same shape as the pandas ids and unique by construction
+        self.con.execute("""
+            CREATE TEMP TABLE signals_out AS
+            SELECT printf('%08x', row_number() OVER (ORDER BY seq, pos, trace_id) - 1) AS signal_id,
+                   signal_name, domain, entity_type, entity_id, study_id, raw_metric_value,
+                   round(score, 4) AS normalized_score,
+                   CASE WHEN score > 0.8 THEN 'Critical' WHEN score > 0.5 THEN 'High'
+                        WHEN score >= 0.2 THEN 'Medium' ELSE 'Low' END AS severity_level,
+                   explanation, ?::TIMESTAMP AS signal_timestamp, trace_id
+            FROM signal_rows
+        """, [datetime.datetime.now()])
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        columns = ("signal_id, signal_name, domain, entity_type, entity_id, study_id, raw_metric_value, "
+                   "normalized_score, severity_level, explanation, signal_timestamp")
+        signals = f"SELECT {columns} FROM signals_out"
+        traces = "SELECT signal_id, trace_id FROM signals_out ORDER BY signal_id"
+        copy_partitioned(self.con, signals, self.output_dir / 'signals.parquet', 'signals', SIGNAL_ORDER)
+        self.con.execute(f"COPY ({signals} ORDER BY {SIGNAL_ORDER}) TO {quote(self.output_dir / 'signals.csv')} (HEADER)")
+        self.con.execute(f"COPY ({traces}) TO {quote(self.output_dir / SIGNAL_TRACES_FILE)} "
+                         f"(FORMAT parquet, ROW_GROUP_SIZE {TRACE_ROW_GROUP})")
+        self.con.execute(f"COPY ({traces}) TO {quote(self.output_dir / 'signal_traces.csv')} (HEADER)")
+        self.build_signal_index(n)
+        print("Done.")
+
+    def build_signal_index(self, n):
+        # Same rule as subject_store.build_signal_index: Subject signals by entity_id, the
+        # rest through the subject that shares a source row with the signal's trace. Row
+        # positions are read back from signals.parquet, as copy_partitioned stored them.
+        self.con.execute(f"""
+            CREATE TEMP TABLE signal_subject AS
+            WITH subject_rows AS (
+                SELECT {ROW_KEY}, arg_min(entity_id, file_row_number) AS subject_id
+                FROM provenance WHERE canonical_entity = 'Subject' GROUP BY ALL
+            ), trace_subject AS (
+                SELECT p.trace_id, any_value(r.subject_id) AS subject_id
+                FROM provenance p JOIN subject_rows r USING ({ROW_KEY}) GROUP BY p.trace_id
+            )
+            SELECT w.file_row_number AS rn,
+                   CASE WHEN s.entity_type = 'Subject' THEN s.entity_id ELSE t.subject_id END AS subject_id
+            FROM signals_out s
+            JOIN (SELECT signal_id, file_row_number FROM {parquet(self.output_dir / 'signals.parquet')}) w USING (signal_id)
+            LEFT JOIN trace_subject t USING (trace_id)
+        """)
+        self.con.execute("""
+            CREATE TEMP TABLE subject_codes AS
+            SELECT subject_id, row_number() OVER (ORDER BY min(rn)) - 1 AS code
+            FROM signal_subject WHERE subject_id IS NOT NULL GROUP BY subject_id
+        """)
+        subject_ids = [r[0] for r in self.con.execute("SELECT subject_id FROM subject_codes ORDER BY code").fetchall()]
+        codes = self.con.execute("""
+            SELECT COALESCE(c.code, -1) AS code FROM signal_subject s LEFT JOIN subject_codes c USING (subject_id)
+            ORDER BY s.rn
+        """).fetchnumpy()['code'].astype(np.int64)
+        save_index(self.output_dir / SIGNAL_INDEX_FILE, subject_ids,
+                   {'signals': csr(codes, len(subject_ids))}, {'signals': n})
@@ -1,25 +1,44 @@
 import os
-import pandas as pd
+import sys
 import json
-import numpy as np
 import datetime
 from pathlib import Path
 
+if not __package__:
+    # `python Phase_4_Aggregation/compute_dqi.py`: only the script's own folder is on sys.path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline.lazy import lazy_import
+from pipeline.metrics import METRICS, timed
+from pipeline.schema import apply_schema, read_table, write_table
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
 # Configuration
-BASE_DIR = Path("/Users/mypro16/Desktop/Novaratis/Data for problem Statement 1")
+# Paths resolve relative to the Data_Analysis folder unless PIPELINE_BASE_DIR overrides them
+BASE_DIR = Path(os.environ.get("PIPELINE_BASE_DIR", Path(__file__).resolve().parent.parent))
 SIGNAL_FILE = BASE_DIR / "Phase_3_Risk_Signals/Signal_Data/signals.parquet"
 OUTPUT_DIR = BASE_DIR / "Phase_4_Aggregation/DQI_Data"
 CONFIG_FILE = BASE_DIR / "Phase_4_Aggregation/Config/weights.json"
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
 class DQIEngine:
-    def __init__(self):
+    def __init__(self, signals=None, signal_file=SIGNAL_FILE, output_dir=OUTPUT_DIR, config_file=CONFIG_FILE):
+        self.signal_file = Path(signal_file)
+        self.output_dir = Path(output_dir)
+        self.config_file = Path(config_file)
+        self.results = {}
         self.load_config()
-        self.load_signals()
+        if signals is not None:
+            # In-process hand-off from Phase 3. Shallow copy so the weight columns
+            # added below don't leak into the caller's frame.
+            self.signals = apply_schema('signals', signals.copy(deep=False))
+            print(f"Received {len(self.signals)} signals.")
+        else:
+            self.load_signals()
+        METRICS.count('rows_read', len(self.signals))
 
     def load_config(self):
-        with open(CONFIG_FILE, 'r') as f:
+        with open(self.config_file, 'r') as f:
             self.config = json.load(f)
         self.weights = self.config['weights']
         # Normalize weights just in case
@@ -27,11 +46,13 @@ class DQIEngine:
         if total_w > 0:
             self.weights = {k: v/total_w for k, v in self.weights.items()}
 
+    @timed()
     def load_signals(self):
-        if not SIGNAL_FILE.exists():
+        if not self.signal_file.exists():
             print("CRITICAL: No signals.parquet found.")
+            self.signals = pd.DataFrame()
             return
-        self.signals = pd.read_parquet(SIGNAL_FILE)
+        self.signals = read_table(self.signal_file, 'signals')
         print(f"Loaded {len(self.signals)} signals.")
 
     def get_risk_level(self, score):
@@ -41,6 +62,7 @@ class DQIEngine:
         if score > thresh['Low']: return "Medium"
         return "Low"
 
+    @timed()
     def compute_dqi(self):
         if self.signals.empty: return
 
@@ -50,7 +72,8 @@ class DQIEngine:
         # Apply Weights
         # Map domain to weight
         # If domain not in config, use default small weight
-        self.signals['weight'] = self.signals['domain'].map(lambda d: self.weights.get(d, 0.05))
+        # (domain is categorical, so the dict lookup runs once per category, not per row)
+        self.signals['weight'] = self.signals['domain'].map(self.weights).astype(float).fillna(0.05)
         
         # Compute Weighted Score per Signal
         self.signals['weighted_score'] = self.signals['normalized_score'] * self.signals['weight']
@@ -58,10 +81,13 @@ class DQIEngine:
         # Aggregation Logic
         # We want to aggregate by (Study, Entity Type, Entity ID)
         
-        self.aggregate_entity("Site")
-        self.aggregate_entity("Subject")
+        for entity_type in ["Site", "Subject"]:
+            grouped = self.aggregate_entity(entity_type)
+            if grouped is not None:
+                self.results[entity_type] = grouped
         # Can also do Visit if needed, but Site/Subject are main DQI drivers
         
+    @timed()
     def aggregate_entity(self, entity_type):
         print(f"Aggregating DQI for {entity_type}...")
         
@@ -84,9 +110,8 @@ class DQIEngine:
             # Site signals (like "Coding Backlog") get Site Score.
             pass
 
-        df_subset = self.signals[self.signals['entity_type'] == entity_type].copy()
-        
-        if df_subset.empty:
+        grouped = self.group_entity(entity_type)
+        if grouped is None:
             print(f"No signals found for {entity_type}")
             return
 
@@ -105,12 +130,6 @@ class DQIEngine:
         # Or just Sum and then define Thresholds for categorization.
         # Let's use Sum for "Risk Score" and then a Sigmoid function for "Index (0-1)".
         
-        grouped = df_subset.groupby(['study_id', 'entity_id']).agg(
-            total_weighted_risk=('weighted_score', 'sum'),
-            signal_count=('signal_id', 'count'),
-            top_domains=('domain', lambda x: list(x.value_counts().index[:3]))
-        ).reset_index()
-        
         # Compute Index (0-1)
         # Using a simple tanh or sigmoid to squash 0-inf to 0-1
         # Risk 5.0 is incredibly high. Risk 0.1 is low.
@@ -121,16 +140,48 @@ class DQIEngine:
         grouped['generated_at'] = datetime.datetime.now().isoformat()
         
         # Save
-        outfile = OUTPUT_DIR / f"ranked_{entity_type.lower()}s.csv"
-        # Join top domain nicely
-        grouped['top_domains'] = grouped['top_domains'].apply(lambda x: "|".join(x))
+        os.makedirs(self.output_dir, exist_ok=True)
+        outfile = self.output_dir / f"ranked_{entity_type.lower()}s.csv"
         
-        grouped.sort_values('dqi_score', ascending=False).to_csv(outfile, index=False)
+        # Stable, so ties keep the (study_id, entity_id) order of the groupby
+        grouped = grouped.sort_values('dqi_score', ascending=False, kind='stable')
+        grouped.to_csv(outfile, index=False)
+        # Also as a dataset partitioned by study_id, in ranking order within each study
+        write_table(grouped, outfile.with_suffix('.parquet'), f"ranked_{entity_type.lower()}s")
         print(f"Saved {len(grouped)} rows to {outfile}")
+        return grouped
+
+    def group_entity(self, entity_type):
+        # One row per (study_id, entity_id): total_weighted_risk, signal_count, top_domains
+        df_subset = self.signals[self.signals['entity_type'] == entity_type].copy()
+        if df_subset.empty:
+            return None
+        grouped = df_subset.groupby(['study_id', 'entity_id'], observed=True).agg(
+            total_weighted_risk=('weighted_score', 'sum'),
+            signal_count=('signal_id', 'count'),
+        ).reset_index()
+        grouped['top_domains'] = self.top_domains(df_subset, grouped)
+        return grouped
+
+    def top_domains(self, df_subset, grouped, n=3):
+        # Up to n most frequent domains per entity, "|"-joined; ties keep first-seen order
+        # (same result as value_counts() per group, without a Python call per group)
+        keys = ['study_id', 'entity_id']
+        counts = (
+            df_subset.reset_index(drop=True).reset_index()
+            .groupby(keys + ['domain'], observed=True)
+            .agg(n=('index', 'size'), first=('index', 'min'))
+            .reset_index()
+            .sort_values(keys + ['n', 'first'], ascending=[True, True, False, True])
+        )
+        top = counts.groupby(keys, observed=True).head(n)
+        joined = top.groupby(keys, observed=True)['domain'].agg(lambda d: "|".join(d.astype(str)))
+        return grouped.set_index(keys).index.map(joined).values
 
     def run(self):
         self.compute_dqi()
         print("Phase 4 DQI Complete.")
+        return self.results
 
 if __name__ == "__main__":
     engine = DQIEngine()
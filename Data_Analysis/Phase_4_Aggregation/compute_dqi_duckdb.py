@@ -0,0 +1,80 @@
+from pathlib import Path
+
+from pipeline.duckdb_backend import DEFAULT_MEMORY_LIMIT, connect, parquet
+from pipeline.metrics import METRICS, timed
+
+from Phase_4_Aggregation.compute_dqi import CONFIG_FILE, OUTPUT_DIR, SIGNAL_FILE, DQIEngine
+
+
+class DuckDBDQIEngine(DQIEngine):
+    # Out-of-core DQIEngine: weighting, grouping and the top-domain ranking run in DuckDB
+    # over signals.parquet, so only one row per ranked entity reaches pandas. Scoring,
+    # risk levels and the CSVs are shared with DQIEngine.
+    def __init__(self, signal_file=SIGNAL_FILE, output_dir=OUTPUT_DIR, config_file=CONFIG_FILE,
+                 memory_limit=DEFAULT_MEMORY_LIMIT, temp_dir=None, threads=None):
+        self.signal_file = Path(signal_file)
+        self.output_dir = Path(output_dir)
+        self.config_file = Path(config_file)
+        self.results = {}
+        self.load_config()
+        self.con = connect(memory_limit, temp_dir or self.output_dir / ".duckdb_tmp", threads)
+        self.load_signals()
+
+    @timed()
+    def load_signals(self):
+        if not self.signal_file.exists():
+            print("CRITICAL: No signals.parquet found.")
+            self.n_signals = 0
+            return
+        self.con.execute(f"CREATE VIEW signals AS SELECT * FROM {parquet(self.signal_file)}")
+        self.n_signals = self.con.execute("SELECT count(*) FROM signals").fetchone()[0]
+        METRICS.count('rows_read', self.n_signals)
+        print(f"Loaded {self.n_signals} signals.")
+
+    @timed()
+    def compute_dqi(self):
+        if not self.n_signals: return
+
+        # Same rules as DQIEngine.compute_dqi: non-numeric scores count as 0 and
+        # domains missing from the config weigh 0.05
+        self.con.execute("CREATE TEMP TABLE weights (domain VARCHAR, weight DOUBLE)")
+        self.con.executemany("INSERT INTO weights VALUES (?, ?)", list(self.weights.items()))
+        self.con.execute("""
+            CREATE VIEW weighted AS
+            SELECT s.*, COALESCE(TRY_CAST(s.normalized_score AS DOUBLE), 0) * COALESCE(w.weight, 0.05) AS weighted_score
+            FROM signals s LEFT JOIN weights w ON CAST(s.domain AS VARCHAR) = w.domain
+        """)
+
+        for entity_type in ["Site", "Subject"]:
+            grouped = self.aggregate_entity(entity_type)
+            if grouped is not None:
+                self.results[entity_type] = grouped
+
+    def group_entity(self, entity_type, n=3):
+        # Rows come back in (study_id, entity_id) order like the pandas groupby, so the
+        # dqi_score sort in aggregate_entity orders ties the same way. fsum is compensated
+        # summation, as pandas uses for groupby sums.
+        grouped = self.con.execute(f"""
+            WITH subset AS (
+                SELECT * FROM weighted
+                WHERE entity_type = ? AND study_id IS NOT NULL AND entity_id IS NOT NULL
+            ), totals AS (
+                SELECT study_id, entity_id, fsum(weighted_score) AS total_weighted_risk,
+                       count(signal_id) AS signal_count
+                FROM subset GROUP BY ALL
+            ), counts AS (
+                SELECT study_id, entity_id, domain, count(*) AS n, min(file_row_number) AS first
+                FROM subset WHERE domain IS NOT NULL GROUP BY ALL
+            ), top AS (
+                SELECT study_id, entity_id, string_agg(domain, '|' ORDER BY n DESC, first) AS top_domains
+                FROM (
+                    SELECT *, row_number() OVER (PARTITION BY study_id, entity_id ORDER BY n DESC, first) AS r
+                    FROM counts
+                )
+                WHERE r <= {int(n)} GROUP BY ALL
+            )
+            SELECT study_id, entity_id, total_weighted_risk, signal_count, top_domains
+            FROM totals LEFT JOIN top USING (study_id, entity_id)
+            ORDER BY study_id, entity_id
+        """, [entity_type]).df()
+        return grouped if not grouped.empty else None
@@ -1,6 +1,15 @@
-import pandas as pd
 import json
 import os
+import sys
+
+if not __package__:
+    # `python Phase_9_GenAI/build_index.py`: only the script's own folder is on sys.path
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline.lazy import lazy_import
+from pipeline.metrics import METRICS, timed
+from pipeline.schema import SIGNAL_TRACES_FILE, TRACE_COLUMNS, read_frame, read_signals, read_table
+
+pd = lazy_import('pandas')
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -8,29 +17,52 @@ SIGNALS_PATH = os.path.join(BASE_DIR, "../Phase_3_Risk_Signals/Signal_Data/signa
 PROVENANCE_PATH = os.path.join(BASE_DIR, "../Phase_2_Ingestion/Canonical_Data/provenance.parquet")
 OUTPUT_PATH = os.path.join(BASE_DIR, "../../web-app/src/data/provenance_index.json")
 
-def build_index():
+def load_provenance(provenance_path):
+    if not os.path.exists(provenance_path):
+        # Try fallback location or skip if strictly required
+        print(f"Warning: {provenance_path} not found. Proceeding with signals only.")
+        return pd.DataFrame()
+    return read_table(provenance_path, 'provenance')
+
+def build_index(signals_df=None, prov_df=None, traces_df=None, signals_path=SIGNALS_PATH, provenance_path=PROVENANCE_PATH, output_path=OUTPUT_PATH):
+    if signals_df is not None:
+        # In-process hand-off from the pipeline orchestrator. A stage that was skipped
+        # (e.g. ingest, when only Phase 3 changed) hands nothing over: read its files.
+        if prov_df is None:
+            prov_df = load_provenance(provenance_path)
+        if traces_df is None:
+            traces_path = os.path.join(os.path.dirname(signals_path), SIGNAL_TRACES_FILE)
+            traces_df = read_frame(traces_path) if os.path.exists(traces_path) else pd.DataFrame(columns=TRACE_COLUMNS)
+        return _write_index(signals_df, prov_df, traces_df, output_path)
+
     print("Loading datasets...")
     try:
-        if not os.path.exists(SIGNALS_PATH):
-            print(f"Error: {SIGNALS_PATH} not found.")
+        if not os.path.exists(signals_path):
+            print(f"Error: {signals_path} not found.")
             return
-        if not os.path.exists(PROVENANCE_PATH):
-             # Try fallback location or skip if strictly required
-             print(f"Warning: {PROVENANCE_PATH} not found. Proceeding with signals only.")
-             prov_df = pd.DataFrame() 
-        else:
-             prov_df = pd.read_parquet(PROVENANCE_PATH)
-
-        signals_df = pd.read_parquet(SIGNALS_PATH)
+        prov_df = load_provenance(provenance_path)
+        signals_df, traces_df = read_signals(signals_path)
     except Exception as e:
         print(f"Error reading parquet files: {e}")
         return
 
+    return _write_index(signals_df, prov_df, traces_df, output_path)
+
+# Helper to clean data for JSON (all columns are scalar)
+def clean_for_json(obj):
+    if isinstance(obj, pd.Timestamp): # signal_timestamp is a real timestamp now
+        return obj.isoformat()
+    if pd.isna(obj): # Check for NaN
+        return None
+    return obj
+
+@timed()
+def _write_index(signals_df, prov_df, traces_df, output_path):
+    METRICS.count('rows_read', len(signals_df))
     print(f"Loaded {len(signals_df)} signals.")
     
     # We want a map: signal_id -> { signal_details, provenance_rows: [] }
-    # Assuming 'trace_id' or 'row_id' links them. 
-    # If explicit link missing in current data, we will mock the linkage for the demo.
+    # signal_traces.parquet links them: signal_id -> trace_id -> provenance row.
     
     index = {}
     
@@ -40,16 +72,19 @@ def build_index():
     
     # Limit to top 2000 for performance
     signals_df = signals_df.head(2000)
+
+    # Evidence for the kept signals: one merge over the edge table, then grouped by signal
+    edges = traces_df[traces_df['signal_id'].isin(signals_df['signal_id'])]
+    if not prov_df.empty:
+        edges = edges.merge(prov_df, on='trace_id', how='left')
+    trace_ids, provenance = {}, {}
+    for rec in edges.to_dict(orient='records'):
+        sig_id = rec.pop('signal_id')
+        trace_ids.setdefault(sig_id, []).append(rec['trace_id'])
+        if not prov_df.empty:
+            provenance.setdefault(sig_id, []).append({k: clean_for_json(v) for k, v in rec.items()})
     
     records = signals_df.to_dict(orient='records')
-    
-    # Helper to clean data for JSON
-    def clean_for_json(obj):
-        if hasattr(obj, 'tolist'): # Check for numpy array
-            return obj.tolist()
-        if pd.isna(obj): # Check for NaN
-            return None
-        return obj
 
     for row in records:
         sig_id = row.get('signal_id') or row.get('id') # Fallback
@@ -57,19 +92,21 @@ def build_index():
         
         # Clean the row data
         cleaned_row = {k: clean_for_json(v) for k, v in row.items()}
+        cleaned_row['trace_ids'] = trace_ids.get(sig_id, [])
         
         index[sig_id] = {
             "signal": cleaned_row,
-            "provenance": [] 
+            "provenance": provenance.get(sig_id, [])
         }
 
-    print(f"Built index with {len(index)} keys. Saving to {OUTPUT_PATH}...")
+    print(f"Built index with {len(index)} keys. Saving to {output_path}...")
     
-    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
-    with open(OUTPUT_PATH, 'w') as f:
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w') as f:
         json.dump(index, f, indent=2)
         
     print("Done.")
+    return index
 
 if __name__ == "__main__":
     build_index()
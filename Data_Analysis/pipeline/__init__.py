@@ -0,0 +1,10 @@
+# Pipeline orchestration for the Data_Analysis phases.
+#
+# Usage (from the Data_Analysis folder):
+#   python -m pipeline run                 # run ingest -> signals -> dqi -> index, skipping unchanged stages
+#   python -m pipeline run --force         # ignore the fingerprint cache
+#   python -m pipeline run --base-dir /data/novartis
+#   python -m pipeline serve               # read API over the signals / DQI outputs
+#
+# Only the standard library is imported here so that an unchanged re-run
+# never pays for pandas / pyarrow imports.
@@ -0,0 +1,134 @@
+import argparse
+import os
+import time
+
+from .config import ARROW_HANDOFF_ENV, DEFAULT_BASE_DIR, PipelineConfig
+
+
+def cmd_run(args):
+    from .metrics import METRICS, profiled
+    from .stages import build_pipeline
+
+    if args.arrow_handoff:
+        os.environ[ARROW_HANDOFF_ENV] = "1"
+
+    config = PipelineConfig(base_dir=args.base_dir, index_path=args.index_path, state_file=args.state_file,
+                            metrics_dir=args.metrics_dir, backend=args.backend, memory_limit=args.memory_limit,
+                            spill_dir=args.spill_dir)
+    pipeline = build_pipeline()
+
+    start = time.perf_counter()
+    try:
+        with profiled(args.profile, config.metrics_dir):
+            _, summary = pipeline.run(config, targets=args.stages, force=args.force, metrics=METRICS)
+    finally:
+        # Written even when a stage fails, so the failing run still shows up in the history
+        if not args.no_metrics:
+            print(f"[metrics] Run metrics written to {METRICS.write(config.metrics_dir)}")
+    total = time.perf_counter() - start
+
+    METRICS.report()
+
+    print("\n[pipeline] Summary")
+    for name, status, seconds in summary:
+        print(f"  {name:<10} {status:<8} {seconds:8.2f}s")
+    print(f"  {'total':<10} {'':<8} {total:8.2f}s")
+
+
+def cmd_generate(args):
+    from .synthetic import generate
+    generate(args.output, scale=args.scale, fmt=args.format, seed=args.seed, rows_factor=args.rows_factor)
+
+
+def cmd_bench(args):
+    from .bench import compare, run_benchmarks, write_results
+
+    results = run_benchmarks(args.scales, fmt=args.format, seed=args.seed, rows_factor=args.rows_factor,
+                             workdir=args.workdir, keep=args.keep)
+    out = write_results(results, args.output_dir or PipelineConfig(DEFAULT_BASE_DIR).metrics_dir, args.format)
+    print(f"\n[bench] Results written to {out}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+def cmd_subject(args):
+    import json
+    from .subject_store import SubjectStore
+
+    config = PipelineConfig(base_dir=args.base_dir)
+    store = SubjectStore(config.canonical_dir, config.signal_dir)
+    if args.subject_id not in store:
+        print(f"Unknown subject {args.subject_id}")
+        return
+    record = {name: json.loads(df.to_json(orient="records", date_format="iso"))
+              for name, df in store.get(args.subject_id).items()}
+    print(json.dumps(record, indent=2))
+
+
+def cmd_serve(args):
+    from .api import serve
+    serve(PipelineConfig(base_dir=args.base_dir), host=args.host, port=args.port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pipeline", description="Clinical trial data quality pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run ingest -> signals -> dqi -> index/previews, skipping stages whose inputs are unchanged")
+    run.add_argument("--base-dir", default=DEFAULT_BASE_DIR, help="Data_Analysis folder holding the Phase_* directories")
+    run.add_argument("--index-path", default=None, help="Where Phase 9 writes provenance_index.json")
+    run.add_argument("--state-file", default=None, help="Fingerprint cache (default: <base-dir>/.pipeline_state.json)")
+    run.add_argument("--stages", nargs="+", choices=["ingest", "signals", "dqi", "index", "previews"],
+                     help="Only run these stages (plus whatever they depend on)")
+    run.add_argument("--force", action="store_true", help="Ignore the fingerprint cache and re-run every stage")
+    run.add_argument("--metrics-dir", default=None, help="Where run metrics go (default: <base-dir>/Pipeline_Metrics)")
+    run.add_argument("--no-metrics", action="store_true", help="Don't write the per-run metrics files")
+    run.add_argument("--profile", choices=["cprofile", "pyinstrument"], default=None,
+                     help="Profile the whole run and write the profile next to the metrics")
+    run.add_argument("--arrow-handoff", action="store_true",
+                     help="Also write uncompressed Arrow IPC copies of the tables; readers memory-map them")
+    run.add_argument("--backend", choices=["pandas", "duckdb"], default="pandas",
+                     help="Signals/DQI execution: in-memory pandas, or out-of-core DuckDB over the Parquet files")
+    run.add_argument("--memory-limit", default=None,
+                     help="duckdb backend: memory cap before spilling to disk (default 2GB)")
+    run.add_argument("--spill-dir", default=None,
+                     help="duckdb backend: where spilled data goes (default: a .duckdb_tmp folder next to the outputs)")
+    run.set_defaults(func=cmd_run)
+
+    gen = sub.add_parser("generate", help="Write synthetic Study_N_Input_Files folders shaped like the real exports")
+    gen.add_argument("output", help="Folder to create the Study_N_Input_Files folders in")
+    gen.add_argument("--scale", type=float, default=1.0, help="Number of studies as a multiple of the 23 shipped ones")
+    gen.add_argument("--rows-factor", type=float, default=1.0, help="Multiplier on rows per sheet")
+    gen.add_argument("--format", choices=["xlsx", "parquet"], default="xlsx")
+    gen.add_argument("--seed", type=int, default=0)
+    gen.set_defaults(func=cmd_generate)
+
+    bench = sub.add_parser("bench", help="Time every stage on synthetic data at several scales")
+    bench.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    bench.add_argument("--rows-factor", type=float, default=1.0, help="Multiplier on rows per sheet")
+    bench.add_argument("--format", choices=["xlsx", "parquet"], default="xlsx",
+                       help="Input format; parquet keeps generation time down at large scales")
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--workdir", default=None, help="Keep the generated data here instead of a temp folder")
+    bench.add_argument("--keep", action="store_true", help="Don't delete the temp folder afterwards")
+    bench.add_argument("--output-dir", default=None, help="Where bench_<timestamp>.json goes (default: Pipeline_Metrics)")
+    bench.add_argument("--baseline", default=None, help="Earlier bench_*.json to compare against")
+    bench.set_defaults(func=cmd_bench)
+
+    subject = sub.add_parser("subject", help="Print everything linked to one subject (queries, forms, visits, labs, signals)")
+    subject.add_argument("subject_id", help='e.g. "Study_10_Subject 3507"')
+    subject.add_argument("--base-dir", default=DEFAULT_BASE_DIR)
+    subject.set_defaults(func=cmd_subject)
+
+    serve = sub.add_parser("serve", help="Serve ranked subjects/sites, signals and KPIs over HTTP (JSON or Arrow)")
+    serve.add_argument("--base-dir", default=DEFAULT_BASE_DIR)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import gzip
+import hashlib
+import json
+import re
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from .dag import fingerprint_paths
+from .schema import PARTITIONS
+from .subject_store import INDEX_FILE, SIGNAL_INDEX_FILE
+
+# Read-only HTTP API over the Phase 3/4 outputs, for the web app:
+#   GET /api/kpis[?study_id=]
+#   GET /api/subjects[?study_id=&risk_level=&offset=&limit=]     ranked_subjects.parquet (or .csv)
+#   GET /api/sites[?study_id=&risk_level=&offset=&limit=]        ranked_sites.parquet (or .csv)
+#   GET /api/signals[?study_id=&domain=&severity_level=&entity_type=&entity_id=&offset=&limit=]
+#   GET /api/subjects/<subject_id>/signals[?offset=&limit=]
+# Pages are JSON ({"total", "offset", "limit", "items"}) or, with `Accept:
+# application/vnd.apache.arrow.stream` / `?format=arrow`, an Arrow IPC stream (total in
+# X-Total-Count). Bodies are gzipped when the client accepts it. ETags come from the
+# stat fingerprint of the files behind the endpoint, so repeat requests get a 304 until
+# the pipeline rewrites them. Filters on a partition column (study_id, signal domain) load
+# just those partitions of the dataset.
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+GZIP_MIN_BYTES = 1024
+
+FILTERS = {
+    'subjects': ['study_id', 'entity_id', 'risk_level'],
+    'sites': ['study_id', 'entity_id', 'risk_level'],
+    'signals': ['study_id', 'domain', 'severity_level', 'entity_type', 'entity_id', 'signal_name'],
+}
+
+# Table (schema.PARTITIONS key) behind each list resource
+TABLES = {'subjects': 'ranked_subjects', 'sites': 'ranked_sites', 'signals': 'signals'}
+
+SUBJECT_SIGNALS = re.compile(r"^/api/subjects/(?P<subject_id>[^/]+)/signals$")
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class DataStore:
+    # Phase 3/4 outputs, loaded on first use and reloaded once their files change
+    def __init__(self, config):
+        self.config = config
+        self.cache = {}     # (name, partition) -> (version, value)
+        self.lock = threading.Lock()
+
+    def sources(self, name):
+        signal_dir, dqi_dir = self.config.signal_dir, self.config.dqi_dir
+        return {
+            'subjects': [ranked_source(dqi_dir, 'subjects')],
+            'sites': [ranked_source(dqi_dir, 'sites')],
+            'signals': [signal_dir / "signals.parquet"],
+            'subject_index': [self.config.canonical_dir / INDEX_FILE, signal_dir / SIGNAL_INDEX_FILE],
+            'open_issues': [self.config.canonical_dir / "subject.parquet"],
+        }[name]
+
+    def version(self, *names):
+        return fingerprint_paths([p for name in names for p in self.sources(name)])
+
+    def get(self, name, partition=()):
+        # `partition`: ((column, value), ...) on partition columns; () = the whole table.
+        # At most one cache entry per partition of the dataset.
+        version = self.version(name)
+        with self.lock:
+            cached = self.cache.get((name, partition))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        missing = [p for p in self.sources(name) if not p.exists()]
+        if missing:
+            raise ApiError(503, f"{missing[0].name} not found; run the pipeline first")
+        value = self.load(name, [(col, '==', value) for col, value in partition] or None)
+        with self.lock:
+            self.cache[(name, partition)] = (version, value)
+        return value
+
+    def load(self, name, filters=None):
+        import pandas as pd
+        from .schema import read_table
+        from .subject_store import SubjectStore
+
+        if name in ('subjects', 'sites'):
+            path = self.sources(name)[0]
+            if path.suffix == '.csv':
+                return pd.read_csv(path, dtype={'study_id': str, 'entity_id': str})
+            # Partitions come back in study order; restore the overall ranking
+            df = read_table(path, TABLES[name], filters)
+            return df.sort_values('dqi_score', ascending=False, kind='stable', ignore_index=True)
+        if name == 'signals':
+            return read_table(self.sources(name)[0], 'signals', filters)
+        if name == 'subject_index':
+            return SubjectStore(self.config.canonical_dir, self.config.signal_dir)
+        if name == 'open_issues':
+            # SubjectIDs with at least one open issue on the EDRR report
+            subjects = read_table(self.sources(name)[0], 'subject')
+            if 'OpenIssueCount' not in subjects.columns:
+                return frozenset()
+            counts = pd.to_numeric(subjects['OpenIssueCount'], errors='coerce')
+            return frozenset(subjects.loc[counts > 0, 'SubjectID'].astype(str))
+
+
+def ranked_source(dqi_dir, name):
+    # The partitioned Parquet ranking, or the CSV for outputs of older runs
+    parquet = dqi_dir / f"ranked_{name}.parquet"
+    return parquet if parquet.exists() else dqi_dir / f"ranked_{name}.csv"
+
+
+def partition_of(resource, query):
+    return tuple((col, query[col]) for col in PARTITIONS.get(TABLES[resource], []) if col in query)
+
+
+def page_params(query):
+    try:
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError(400, "offset and limit must be integers")
+    if offset < 0 or not 0 < limit <= MAX_LIMIT:
+        raise ApiError(400, f"need offset >= 0 and 0 < limit <= {MAX_LIMIT}")
+    return offset, limit
+
+
+def apply_filters(df, resource, query):
+    for col in FILTERS[resource]:
+        if col in query and col in df.columns:
+            df = df[df[col] == query[col]]
+    return df
+
+
+def kpis(subjects, open_issues):
+    # Headline numbers of the dashboard, from the ranked subjects and the SubjectIDs with
+    # open issues (DataStore 'open_issues')
+    total = len(subjects)
+    at_risk = int(subjects['risk_level'].isin(['High', 'Critical']).sum())
+    return {
+        'total_subjects': total,
+        'critical_subjects': int((subjects['risk_level'] == 'Critical').sum()),
+        'subjects_with_open_issues': int(subjects['entity_id'].astype(str).isin(open_issues).sum()),
+        'data_readiness_risk_pct': round(100.0 * at_risk / total, 1) if total else 0.0,
+    }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "PipelineAPI/1.0"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            self.route(url.path.rstrip('/') or '/', query)
+        except ApiError as e:
+            self.send_json(e.status, {'error': str(e)})
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # A bug or an unreadable output file: log it and still answer in JSON
+            self.log_error("%s failed:\n%s", self.path, traceback.format_exc())
+            self.send_json(500, {'error': f"Internal error: {type(e).__name__}: {e}"})
+
+    def route(self, path, query):
+        store = self.server.store
+        match = SUBJECT_SIGNALS.match(path)
+        if path == '/api/kpis':
+            self.respond(store.version('subjects', 'open_issues'), query, lambda: kpis(apply_filters(
+                store.get('subjects', partition_of('subjects', query)), 'subjects', query), store.get('open_issues')))
+        elif path in ('/api/subjects', '/api/sites', '/api/signals'):
+            resource = path.rsplit('/', 1)[1]
+            self.respond(store.version(resource), query, lambda: self.paginate(
+                apply_filters(store.get(resource, partition_of(resource, query)), resource, query), query))
+        elif match:
+            subject_id = unquote(match.group('subject_id'))
+            self.respond(store.version('subject_index', 'signals'), query, lambda: self.subject_signals(subject_id, query))
+        else:
+            raise ApiError(404, f"Unknown endpoint {path}")
+
+    def subject_signals(self, subject_id, query):
+        store = self.server.store
+        index = store.get('subject_index')
+        if subject_id not in index:
+            raise ApiError(404, f"Unknown subject {subject_id}")
+        rows = index.rows(subject_id, 'signals')
+        return self.paginate(store.get('signals').iloc[rows], query)
+
+    def paginate(self, df, query):
+        offset, limit = page_params(query)
+        return len(df), offset, limit, df.iloc[offset:offset + limit]
+
+    # --- responses ---
+    def wants_arrow(self, query):
+        return query.get('format') == 'arrow' or ARROW_STREAM in self.headers.get('Accept', '')
+
+    def respond(self, version, query, build):
+        # ETag = data version + the request (path, query, representation). Checked before
+        # `build` runs, so a 304 never touches the data.
+        arrow = self.wants_arrow(query)
+        tag = hashlib.sha256(f"{version}|{self.path}|{arrow}".encode('utf-8')).hexdigest()[:32]
+        etag = f'W/"{tag}"'
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_common_headers(etag)
+            self.end_headers()
+            return
+
+        result = build()
+        if isinstance(result, tuple):
+            total, offset, limit, page = result
+            if arrow:
+                self.send_body(200, arrow_stream(page, total), ARROW_STREAM, etag, total)
+            else:
+                items = json.loads(page.to_json(orient='records', date_format='iso'))
+                self.send_json(200, {'total': total, 'offset': offset, 'limit': limit, 'items': items}, etag, total)
+        else:
+            self.send_json(200, result, etag)
+
+    def send_json(self, status, payload, etag=None, total=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_body(status, body, 'application/json', etag, total)
+
+    def send_body(self, status, body, content_type, etag=None, total=None):
+        if len(body) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=6)
+            encoding = 'gzip'
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_common_headers(etag)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if total is not None:
+            self.send_header('X-Total-Count', str(total))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_common_headers(self, etag):
+        # no-cache = store but revalidate, which is what makes the ETag round trip happen
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept, Accept-Encoding')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, X-Total-Count')
+        if etag:
+            self.send_header('ETag', etag)
+
+
+def arrow_stream(df, total):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'total': str(total).encode()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def make_server(config, host="127.0.0.1", port=8000):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.store = DataStore(config)
+    return server
+
+
+def serve(config, host="127.0.0.1", port=8000):
+    server = make_server(config, host, port)
+    print(f"[api] Serving {config.base_dir} on http://{host}:{server.server_port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,119 @@
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .config import PipelineConfig
+
+STAGES = ["ingest", "signals", "dqi", "index"]
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def prepare_base_dir(base_dir, scale, fmt, seed, rows_factor):
+    # A throwaway Data_Analysis-shaped folder: synthetic sources plus the real schema and weights
+    from .synthetic import generate
+
+    repo = PipelineConfig(ROOT_DIR)
+    config = PipelineConfig(base_dir)
+    os.makedirs(config.schema_file.parent, exist_ok=True)
+    os.makedirs(config.weights_file.parent, exist_ok=True)
+    shutil.copy(repo.schema_file, config.schema_file)
+    shutil.copy(repo.weights_file, config.weights_file)
+
+    start = time.perf_counter()
+    n_studies, total_rows = generate(config.source_dir, scale=scale, fmt=fmt, seed=seed, rows_factor=rows_factor)
+    return config, n_studies, total_rows, time.perf_counter() - start
+
+
+def run_stage(config, stage, log):
+    # Each stage runs in a fresh interpreter so peak RSS is that stage's own;
+    # upstream stages are already cached, so only `stage` actually executes.
+    cmd = [
+        sys.executable, "-m", "pipeline", "run",
+        "--base-dir", str(config.base_dir),
+        "--index-path", str(config.base_dir / "provenance_index.json"),
+        "--metrics-dir", str(config.metrics_dir),
+        "--stages", stage,
+    ]
+    env = dict(os.environ, PIPELINE_BASE_DIR=str(config.base_dir))
+    before = set(config.metrics_dir.glob("run_*.json")) if config.metrics_dir.exists() else set()
+    subprocess.run(cmd, cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+
+    new_files = sorted(set(config.metrics_dir.glob("run_*.json")) - before)
+    with open(new_files[-1], "r") as f:
+        metrics = json.load(f)
+    for record in metrics["stages"]:
+        if record["stage"] == stage and record["status"] == "ran":
+            return record
+    raise RuntimeError(f"Stage '{stage}' did not run (see {log.name})")
+
+
+def run_benchmarks(scales, fmt="xlsx", seed=0, rows_factor=1.0, workdir=None, keep=False):
+    results = []
+    root = Path(workdir) if workdir else Path(tempfile.mkdtemp(prefix="pipeline_bench_"))
+    try:
+        for scale in scales:
+            base_dir = root / f"scale_{scale:g}"
+            if base_dir.exists():
+                shutil.rmtree(base_dir)
+            print(f"\n[bench] scale {scale:g}x: generating {fmt} inputs...")
+            config, n_studies, total_rows, gen_seconds = prepare_base_dir(base_dir, scale, fmt, seed, rows_factor)
+            print(f"[bench] generated in {gen_seconds:.1f}s")
+
+            with open(base_dir / "bench.log", "w") as log:
+                for stage in STAGES:
+                    record = run_stage(config, stage, log)
+                    seconds = record["seconds"]
+                    rows_in = record.get("rows_in") or 0
+                    row = {
+                        "scale": scale,
+                        "studies": n_studies,
+                        "source_rows": total_rows,
+                        "stage": stage,
+                        "seconds": seconds,
+                        "rows_in": rows_in,
+                        "rows_out": record.get("rows_out"),
+                        "rows_per_sec": round(rows_in / seconds, 1) if seconds > 0 else None,
+                        "peak_rss_bytes": record.get("peak_rss_bytes"),
+                    }
+                    results.append(row)
+                    print(f"[bench]   {stage:<8} {seconds:9.2f}s {rows_in:>10} rows in "
+                          f"{row['rows_per_sec'] or 0:>12.0f} rows/s  peak RSS {(row['peak_rss_bytes'] or 0) / 2**20:8.1f} MiB")
+    finally:
+        if not keep and not workdir:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline_file):
+    with open(baseline_file, "r") as f:
+        baseline = {(r["scale"], r["stage"]): r for r in json.load(f)["results"]}
+    print(f"\n[bench] Compared with {baseline_file} (ratio > 1 is slower)")
+    for r in results:
+        old = baseline.get((r["scale"], r["stage"]))
+        if old and old["seconds"]:
+            ratio = r["seconds"] / old["seconds"]
+            flag = "  <-- regression" if ratio > 1.2 else ""
+            print(f"  {r['scale']:>6g}x {r['stage']:<8} {old['seconds']:9.2f}s -> {r['seconds']:9.2f}s  x{ratio:5.2f}{flag}")
+
+
+def write_results(results, output_dir, fmt):
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    path = output_dir / f"bench_{stamp}.json"
+    with open(path, "w") as f:
+        json.dump({
+            "created_at": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "format": fmt,
+            "results": results,
+        }, f, indent=2)
+    return path
@@ -0,0 +1,52 @@
+import os
+from pathlib import Path
+
+# Default to the Data_Analysis folder this package lives in
+DEFAULT_BASE_DIR = Path(os.environ.get("PIPELINE_BASE_DIR", Path(__file__).resolve().parent.parent))
+
+# Opt-in Arrow IPC copies of the hand-off tables (see schema.write_table). An environment
+# variable so the phase scripts and bench subprocesses pick it up as well.
+ARROW_HANDOFF_ENV = "PIPELINE_ARROW_HANDOFF"
+
+
+def arrow_handoff():
+    return os.environ.get(ARROW_HANDOFF_ENV, "") not in ("", "0")
+
+
+def arrow_path(path):
+    return Path(path).with_suffix('.arrow')
+
+
+class PipelineConfig:
+    def __init__(self, base_dir=DEFAULT_BASE_DIR, index_path=None, state_file=None, metrics_dir=None,
+                 backend="pandas", memory_limit=None, spill_dir=None):
+        self.base_dir = Path(base_dir).resolve()
+
+        # Phases 3/4 execution: "pandas" (in memory) or "duckdb" (out-of-core, see duckdb_backend.py)
+        self.backend = backend
+        self.memory_limit = memory_limit
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+
+        # Phase 2
+        self.source_dir = self.base_dir / "Phase_1_Standardization/Standardized_Study_Files"
+        self.canonical_dir = self.base_dir / "Phase_2_Ingestion/Canonical_Data"
+        self.schema_file = self.base_dir / "Phase_2_Ingestion/Deliverables/Schema_Registry/canonical_schema_v1.json"
+
+        # Phase 3
+        self.signal_dir = self.base_dir / "Phase_3_Risk_Signals/Signal_Data"
+
+        # Phase 4
+        self.dqi_dir = self.base_dir / "Phase_4_Aggregation/DQI_Data"
+        self.weights_file = self.base_dir / "Phase_4_Aggregation/Config/weights.json"
+
+        # Web app exports (files.json preview index, see previews.py)
+        self.ui_dir = self.base_dir / "ui_exports"
+
+        # Phase 9 (same default location build_index.py uses)
+        self.index_path = Path(index_path) if index_path else self.base_dir.parent / "web-app/src/data/provenance_index.json"
+
+        # Fingerprints of the last successful run of each stage
+        self.state_file = Path(state_file) if state_file else self.base_dir / ".pipeline_state.json"
+
+        # Per-run metrics (JSON + Parquet) and optional profiler output
+        self.metrics_dir = Path(metrics_dir) if metrics_dir else self.base_dir / "Pipeline_Metrics"
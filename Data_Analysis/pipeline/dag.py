@@ -0,0 +1,187 @@
+import datetime
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from .metrics import count_rows
+
+
+def iter_files(path):
+    # A directory input stands for every (non-hidden) file underneath it
+    path = Path(path)
+    if path.is_dir():
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for name in sorted(files):
+                if not name.startswith('.'):
+                    yield Path(root) / name
+    elif path.exists():
+        yield path
+
+
+def fingerprint_paths(paths):
+    # Stat-based fingerprint (path, size, mtime) - cheap enough to run on every
+    # invocation, and any rewrite of an input changes it.
+    h = hashlib.sha256()
+    for path in paths:
+        for f in iter_files(path):
+            st = f.stat()
+            h.update(f"{f}|{st.st_size}|{st.st_mtime_ns}\n".encode('utf-8'))
+        if not Path(path).exists():
+            h.update(f"{path}|missing\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), inputs=None, outputs=None, derive=None, params=None):
+        self.name = name
+        self.func = func            # func(config, upstream) -> in-memory result
+        self.deps = list(deps)
+        self.inputs = inputs        # inputs(config) -> files/dirs this stage reads (incl. its own code)
+        self.outputs = outputs      # outputs(config) -> files that must exist to skip the stage
+        self.params = params        # params(config) -> JSON-able settings that change the outputs
+        # derive(config): refreshes files derived from the outputs (e.g. Arrow copies). Runs
+        # after the stage whether it ran or was skipped, and is not part of any fingerprint.
+        self.derive = derive
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = {s.name: s for s in stages}
+        self.order = self.topological_order()
+
+    def topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in pipeline at stage '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def load_state(self, config):
+        if config.state_file.exists():
+            try:
+                with open(config.state_file, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                print(f"Warning: ignoring unreadable state file {config.state_file}")
+        return {}
+
+    def save_state(self, config, state):
+        tmp = config.state_file.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, config.state_file)
+
+    def fingerprint(self, stage, config, fingerprints):
+        # A stage's key covers its own inputs and params plus, for every dependency, its key
+        # and the stat fingerprint of its outputs as they are now. A change anywhere in the chain,
+        # or an upstream stage re-running and rewriting its files, invalidates every stage below.
+        h = hashlib.sha256()
+        h.update(stage.name.encode('utf-8'))
+        for dep in stage.deps:
+            h.update(fingerprints[dep].encode('utf-8'))
+        if stage.inputs:
+            h.update(fingerprint_paths(stage.inputs(config)).encode('utf-8'))
+        if stage.params:
+            h.update(json.dumps(stage.params(config), sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    @staticmethod
+    def downstream_key(fingerprint, outputs):
+        return hashlib.sha256(f"{fingerprint}|{outputs}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def refresh_derived(stage, config, metrics):
+        if stage.derive is None:
+            return
+        if metrics is None:
+            stage.derive(config)
+            return
+        with metrics.timer(f"{stage.name}.derive"):
+            stage.derive(config)
+
+    def run(self, config, targets=None, force=False, metrics=None):
+        wanted = self.order
+        if targets:
+            wanted = set()
+            stack = list(targets)
+            while stack:
+                name = stack.pop()
+                if name not in wanted:
+                    wanted.add(name)
+                    stack.extend(self.stages[name].deps)
+            wanted = [n for n in self.order if n in wanted]
+
+        state = self.load_state(config)
+        fingerprints, results, summary = {}, {}, []
+        ran = set()
+
+        for name in wanted:
+            stage = self.stages[name]
+            fp = self.fingerprint(stage, config, fingerprints)
+
+            outputs = stage.outputs(config) if stage.outputs else []
+            previous = state.get(name, {})
+            up_to_date = (
+                not force
+                # Also covers dependencies without declared outputs
+                and not ran.intersection(stage.deps)
+                and previous.get('fingerprint') == fp
+                and all(Path(p).exists() for p in outputs)
+                # Outputs rewritten outside the pipeline (e.g. a phase script run by hand) force a re-run
+                and previous.get('outputs') == fingerprint_paths(outputs)
+            )
+            if up_to_date:
+                print(f"[pipeline] {name}: up to date, skipped")
+                fingerprints[name] = self.downstream_key(fp, previous['outputs'])
+                # Downstream stages fall back to reading this stage's files from disk
+                results[name] = None
+                summary.append((name, 'skipped', 0.0))
+                if metrics is not None:
+                    metrics.skipped(name)
+                self.refresh_derived(stage, config, metrics)
+                continue
+
+            print(f"[pipeline] {name}: running...")
+            start = time.perf_counter()
+            upstream = {dep: results.get(dep) for dep in stage.deps}
+            if metrics is not None:
+                with metrics.stage(name) as record:
+                    results[name] = stage.func(config, upstream)
+                    record['rows_out'] = count_rows(results[name])
+            else:
+                results[name] = stage.func(config, upstream)
+            elapsed = time.perf_counter() - start
+
+            written = fingerprint_paths(outputs)
+            ran.add(name)
+            fingerprints[name] = self.downstream_key(fp, written)
+            state[name] = {
+                'fingerprint': fp,
+                'outputs': written,
+                'finished_at': datetime.datetime.now().isoformat(),
+                'seconds': round(elapsed, 3),
+            }
+            # Persist after every stage so a failure later on keeps earlier work cached
+            self.save_state(config, state)
+            summary.append((name, 'ran', elapsed))
+            print(f"[pipeline] {name}: done in {elapsed:.2f}s")
+            self.refresh_derived(stage, config, metrics)
+
+        return results, summary
@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+
+from .schema import COMMON_METADATA, PARTITIONS, ROW_GROUP_SIZE, dataset_files, partition_columns, remove_path
+
+# Optional out-of-core backend for Phases 3/4. DuckDB runs the domain logic as SQL over the
+# Parquet files and spills sorts/joins/aggregates to `temp_dir` once `memory_limit` is hit,
+# so peak memory follows the setting instead of the data size.
+DEFAULT_MEMORY_LIMIT = "2GB"
+
+
+def connect(memory_limit=DEFAULT_MEMORY_LIMIT, temp_dir=None, threads=None):
+    try:
+        import duckdb
+    except ImportError:
+        raise RuntimeError("The duckdb backend needs the duckdb package (pip install duckdb)") from None
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = {quote(memory_limit)}")
+    if temp_dir is not None:
+        Path(temp_dir).mkdir(parents=True, exist_ok=True)
+        con.execute(f"SET temp_directory = {quote(temp_dir)}")
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    # Row order is fixed by explicit ORDER BYs, so operators may stream out of order
+    con.execute("SET preserve_insertion_order = false")
+    return con
+
+
+def quote(value):
+    # SQL string literal (SET and read_parquet() arguments can't be bound as parameters)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def parquet(path):
+    # Table source with each row's position in the table, for pandas-equivalent ordering.
+    # For a partitioned dataset the partition columns come from the directory names (as
+    # schema.dataset_files decodes them) and file_row_number is made table-wide: each
+    # file's rows are offset by the rows of the files before it.
+    files = dataset_files(path)
+    if files == [(Path(path), {})]:
+        return f"read_parquet({quote(path)}, file_row_number = true)"
+    import pyarrow.parquet as pq
+
+    names = pq.read_schema(Path(path) / COMMON_METADATA).names
+    columns = partition_columns(path)
+    rows, base = [], 0
+    for f, values in files:
+        literals = ['NULL' if values.get(c) is None else quote(values[c]) for c in columns]
+        rows.append(f"({', '.join([quote(f), str(base)] + literals)})")
+        base += pq.read_metadata(f).num_rows
+    select = ', '.join(f'p."{c}"' if c in columns else f'd."{c}"' for c in names)
+    return (f"(SELECT {select}, d.file_row_number + p.base AS file_row_number "
+            f"FROM read_parquet([{', '.join(quote(f) for f, _ in files)}], file_row_number = true, "
+            f"filename = true, hive_partitioning = false, union_by_name = true) d "
+            f"JOIN (VALUES {', '.join(rows)}) p(file, base{''.join(', ' + c for c in columns)}) "
+            f"ON d.filename = p.file)")
+
+
+def copy_partitioned(con, query, path, name, order_by, row_group_size=ROW_GROUP_SIZE):
+    # COPY `query` to table `name`'s layout (see schema.write_table) in one partitioned
+    # write: a `column=value` directory per partition holding files without the partition
+    # columns, plus the full schema in _common_metadata; swapped in whole once written.
+    # Rows go out sorted by `order_by`, but DuckDB may flush a partition's last partial row
+    # group after later ones, so readers that need exact positions read them back
+    # (parquet() numbers rows as they are stored).
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    columns = PARTITIONS[name]
+    tmp = path.with_name(f".{path.name}.tmp")
+    remove_path(tmp)
+    con.execute(f"COPY (SELECT * FROM ({query}) ORDER BY {order_by}) TO {quote(tmp)} "
+                f"(FORMAT parquet, PARTITION_BY ({', '.join(columns)}), ROW_GROUP_SIZE {int(row_group_size)}, "
+                f"FILENAME_PATTERN 'part-{{i}}')")
+    schema = con.execute(f"SELECT * FROM ({query}) LIMIT 0").arrow().schema
+    if not tmp.is_dir():
+        # No rows, no partitions: one empty file with the full schema
+        tmp.mkdir(parents=True)
+        pq.write_table(schema.empty_table(), tmp / "part-0.parquet")
+    pq.write_metadata(schema, tmp / COMMON_METADATA)
+    remove_path(path)
+    os.replace(tmp, path)
+
+
+def column_types(con, relation):
+    return {name: dtype for name, dtype, *_ in con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()}
@@ -0,0 +1,35 @@
+import importlib
+import sys
+import threading
+import types
+
+# Deferred imports for the phase modules, so importing an engine (API worker, test
+# process, `python -m pipeline` with nothing to re-run) doesn't pay for pandas / numpy /
+# jsonschema until the first attribute is used:
+#
+#     pd = lazy_import('pandas')
+#     ...
+#     df = pd.DataFrame(rows)     # pandas is imported here
+#
+# The real module is imported under a lock on first access and its namespace copied in,
+# so later lookups cost the same as on the module itself. (importlib.util.LazyLoader
+# isn't thread-safe before 3.12, and the ingestion reader threads may race on first use.)
+_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    def __getattr__(self, attr):
+        # Only called for names not in the namespace yet, i.e. before the first load
+        with _lock:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __dir__(self):
+        return dir(importlib.import_module(self.__name__))
+
+
+def lazy_import(name):
+    # Modules someone already imported are returned as-is
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
@@ -0,0 +1,251 @@
+import contextlib
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes():
+    # Process high-water mark since start (or since the last reset_peak_rss on Linux)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def reset_peak_rss():
+    # Linux 4.0+: writing 5 to clear_refs resets the high-water mark to the current RSS, so
+    # the peak read at the end of a stage is that stage's own. False where unsupported.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def rss_status_bytes():
+    # (current RSS, high-water mark since the last reset) from /proc, Linux only. Unlike
+    # ru_maxrss this isn't pinned by the peak of reader threads that have since exited.
+    try:
+        with open("/proc/self/status", "r") as f:
+            fields = dict(line.split(":", 1) for line in f.read().splitlines() if ":" in line)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def io_bytes():
+    # Bytes passed through read()/write() syscalls, Linux only
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def count_rows(result):
+    # Stage results are a DataFrame, a dict of DataFrames (rows per table, e.g. signals and
+    # signal_traces kept apart), or something else (index dict)
+    if result is None:
+        return None
+    if hasattr(result, "shape"):
+        return int(result.shape[0])
+    if isinstance(result, dict):
+        sizes = {k: int(v.shape[0]) for k, v in result.items() if hasattr(v, "shape")}
+        return sizes if sizes else len(result)
+    return None
+
+
+class RunMetrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.datetime.now().isoformat()
+        self.stages = []
+        self.timers = {}     # name -> {'calls': n, 'seconds': s}
+        self.counters = {}   # name -> n
+        self.peak_rss = peak_rss_bytes()     # process peak, kept here as stages reset the kernel's
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        # For work timed outside a timer, e.g. one entry per batch of rows
+        with self.lock:
+            t = self.timers.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            t['calls'] += calls
+            t['seconds'] += seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # Yields the stage record so the caller can fill in rows_out / status
+        record = {'stage': name, 'status': 'ran'}
+        counters_before = dict(self.counters)
+        read_before, written_before = io_bytes()
+        per_stage_peak = reset_peak_rss()
+        rss_before, _ = rss_status_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception:
+            record['status'] = 'failed'
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 4)
+            read_after, written_after = io_bytes()
+            if read_before is not None:
+                record['bytes_read'] = read_after - read_before
+                record['bytes_written'] = written_after - written_before
+            _, stage_peak = rss_status_bytes()
+            self.peak_rss = max(self.peak_rss or 0, stage_peak or 0, peak_rss_bytes() or 0) or None
+            # Without a reset (non-Linux) there is no stage peak, only the process's
+            if per_stage_peak and stage_peak is not None:
+                record['rss_start_bytes'] = rss_before
+                record['peak_rss_bytes'] = stage_peak
+            else:
+                record['peak_rss_bytes'] = None
+            record['process_peak_rss_bytes'] = self.peak_rss
+            delta = {k: v - counters_before.get(k, 0) for k, v in self.counters.items() if v != counters_before.get(k, 0)}
+            record['rows_in'] = delta.get('rows_read', 0)
+            record['quarantined'] = sum(v for k, v in delta.items() if k.startswith('quarantined.'))
+            record['counters'] = delta
+            self.stages.append(record)
+
+    def skipped(self, name):
+        self.stages.append({'stage': name, 'status': 'skipped', 'seconds': 0.0})
+
+    def to_dict(self):
+        return {
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'finished_at': datetime.datetime.now().isoformat(),
+            'peak_rss_bytes': max(self.peak_rss or 0, peak_rss_bytes() or 0) or None,
+            'stages': self.stages,
+            'timers': {k: {'calls': v['calls'], 'seconds': round(v['seconds'], 4)} for k, v in sorted(self.timers.items())},
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def to_rows(self):
+        # Long format (one metric per row) so nightly runs can simply be concatenated
+        rows = []
+        for s in self.stages:
+            for metric, value in s.items():
+                if metric in ('stage', 'status', 'counters') or value is None:
+                    continue
+                # rows_out of a multi-table stage: one rows_out.<table> metric per table
+                values = {f"{metric}.{k}": v for k, v in value.items()} if isinstance(value, dict) else {metric: value}
+                for metric_name, v in values.items():
+                    rows.append({'run_id': self.run_id, 'kind': 'stage', 'name': s['stage'], 'metric': metric_name, 'value': float(v)})
+        for name, t in self.timers.items():
+            rows.append({'run_id': self.run_id, 'kind': 'timer', 'name': name, 'metric': 'calls', 'value': float(t['calls'])})
+            rows.append({'run_id': self.run_id, 'kind': 'timer', 'name': name, 'metric': 'seconds', 'value': t['seconds']})
+        for name, n in self.counters.items():
+            rows.append({'run_id': self.run_id, 'kind': 'counter', 'name': name, 'metric': 'count', 'value': float(n)})
+        return rows
+
+    def write(self, output_dir):
+        output_dir = Path(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+        json_path = output_dir / f"run_{stamp}_{self.run_id}.json"
+        with open(json_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+        # Parquet copy for querying across runs; skipped if pandas/pyarrow are unavailable
+        try:
+            import pandas as pd
+            pd.DataFrame(self.to_rows()).to_parquet(json_path.with_suffix('.parquet'), index=False)
+        except ImportError:
+            pass
+        return json_path
+
+    def report(self, top=15):
+        print("\n[metrics] Slowest timers")
+        ranked = sorted(self.timers.items(), key=lambda kv: kv[1]['seconds'], reverse=True)[:top]
+        for name, t in ranked:
+            print(f"  {name:<45} {t['calls']:>8} calls {t['seconds']:10.3f}s")
+        quarantined = {k: v for k, v in self.counters.items() if k.startswith('quarantined.')}
+        if quarantined:
+            print("[metrics] Quarantined rows: " + ", ".join(f"{k.split('.', 1)[1]}={v}" for k, v in sorted(quarantined.items())))
+
+
+# Process-wide collector: the phase scripts record into it, the orchestrator writes it out
+METRICS = RunMetrics()
+
+
+def timed(name=None):
+    # Decorator form of METRICS.timer; defaults to the function's qualified name
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.timer(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def profiled(kind, output_dir):
+    # Optional whole-run profiler: 'cprofile' (stdlib) or 'pyinstrument' (if installed)
+    if not kind:
+        yield
+        return
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("[metrics] pyinstrument is not installed, falling back to cProfile")
+            kind = 'cprofile'
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                out = output_dir / f"profile_{stamp}.html"
+                with open(out, 'w') as f:
+                    f.write(profiler.output_html())
+                print(f"[metrics] Profile written to {out}")
+            return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out = output_dir / f"profile_{stamp}.prof"
+        profiler.dump_stats(out)
+        print(f"[metrics] Profile written to {out} (view with: python -m pstats {out.name})")
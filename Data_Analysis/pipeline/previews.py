@@ -0,0 +1,263 @@
+import csv
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from .dag import iter_files
+from .metrics import METRICS, timed
+from .schema import COMMON_METADATA, dataset_files, with_partitions
+
+# Preview index behind the web app's Files view (ui_exports/files.json). For every raw
+# workbook and every Phase 2-4 output it keeps the column names and first PREVIEW_ROWS rows
+# of each sheet, read without decoding the rest of the file: xlsx through openpyxl's
+# streaming read-only mode, Parquet one record batch, CSV line by line.
+#
+#   ui_exports/files.json              {category: [{name, path, folder, size, modified,
+#                                                   mtime_ns, sha256, sheets, preview_shard}]}
+#   ui_exports/file_previews/<id>.json {"type": "multi", "sheets": {name: {columns, rows}}}
+#                                      or {"type": "single", "columns", "rows"}
+#
+# `preview_shard` is the shard path relative to ui_exports. Older files.json versions carried
+# the preview inline under `preview`, so that key is not reused for a path. Shards are named
+# by content hash (and row count), and the previous manifest is the cache: a file whose size
+# and mtime are unchanged, or whose content hashes the same after a touch or re-copy, keeps
+# its shard. Regenerating after one new upload costs one partial workbook read.
+PREVIEW_ROWS = 5
+MANIFEST_FILE = "files.json"
+SHARD_DIR = "file_previews"
+
+# File types the Files view lists
+SUFFIXES = {'.xlsx', '.parquet', '.csv'}
+
+
+def categories(config):
+    return {
+        'raw': config.source_dir,
+        'canonical': config.canonical_dir,
+        'signals': config.signal_dir,
+        'aggregates': config.dqi_dir,
+    }
+
+
+def list_tables(root):
+    # Table files under `root`; a Parquet dataset directory (schema.write_table) is one table.
+    # Hidden folders (spill, half-written datasets) and Excel lock files are skipped.
+    tables = []
+    for directory, dirs, files in os.walk(root):
+        directory = Path(directory)
+        for name in sorted(dirs):
+            if name.endswith('.parquet'):
+                tables.append(directory / name)
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and not d.endswith('.parquet'))
+        tables.extend(directory / f for f in files
+                      if Path(f).suffix in SUFFIXES and not f.startswith(('.', '~$')))
+    return sorted(tables)
+
+
+def stat_table(path):
+    # (size, mtime_ns) of a file, or summed / latest over a dataset's files
+    stats = [f.stat() for f in iter_files(path)]
+    return sum(s.st_size for s in stats), max((s.st_mtime_ns for s in stats), default=0)
+
+
+def hash_table(path):
+    h = hashlib.sha256()
+    dataset = path.is_dir()
+    for f in iter_files(path):
+        if dataset:
+            h.update(f"{f.relative_to(path)}\n".encode('utf-8'))
+        with open(f, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def shard_name(sha256, rows):
+    return f"{sha256[:24]}-{rows}.json"
+
+
+# --- readers: column names + first `rows` rows as strings, "" for empty cells ---
+def cell_text(value):
+    return "" if value is None or value != value else str(value)
+
+
+def header_names(cells):
+    # Column names the way pandas reads a header row: blanks become "Unnamed: i" and
+    # repeats get a ".1", ".2" suffix
+    names, seen = [], {}
+    for i, cell in enumerate(cells):
+        name = cell_text(cell) or f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def sheet_preview(sheet_rows):
+    # `sheet_rows`: header row + data rows as tuples of cell values. Trailing empty rows and
+    # cells are dropped, like pandas does with the sheet's used range.
+    sheet_rows = list(sheet_rows)
+    while sheet_rows and not any(cell_text(v) for v in sheet_rows[-1]):
+        sheet_rows.pop()
+    width = max((i + 1 for row in sheet_rows for i, v in enumerate(row) if cell_text(v)), default=0)
+    padded = [list(row[:width]) + [None] * (width - len(row[:width])) for row in sheet_rows]
+    if not padded:
+        return {'columns': [], 'rows': []}
+    return {'columns': header_names(padded[0]), 'rows': [[cell_text(v) for v in row] for row in padded[1:]]}
+
+
+def preview_xlsx(path, rows):
+    # read_only streams each sheet's XML, so only the first rows + 1 rows are parsed
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = {}
+        for sheet in workbook.worksheets:
+            sheet.reset_dimensions()    # exports often carry a wrong <dimension>; don't trust it
+            sheets[sheet.title] = sheet_preview(list(sheet.iter_rows(max_row=rows + 1, values_only=True)))
+        return {'type': 'multi', 'sheets': sheets}
+    finally:
+        workbook.close()
+
+
+def preview_parquet(path, rows):
+    # Only the first row group is decoded
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    file, values = dataset_files(path)[0]
+    reader = pq.ParquetFile(file)
+    batch = next(reader.iter_batches(batch_size=rows), None)
+    table = reader.schema_arrow.empty_table() if batch is None else pa.Table.from_batches([batch])
+    if path.is_dir():
+        # Partition columns are only in the directory names; _common_metadata has the full schema
+        table = with_partitions(table, values, pq.read_schema(path / COMMON_METADATA))
+    return {'type': 'single', 'columns': table.column_names,
+            'rows': [[cell_text(v) for v in row.values()] for row in table.to_pylist()]}
+
+
+def preview_csv(path, rows):
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        body = [row for _, row in zip(range(rows), reader)]
+    return {'type': 'single', 'columns': header_names(header), 'rows': body}
+
+
+READERS = {'.xlsx': preview_xlsx, '.parquet': preview_parquet, '.csv': preview_csv}
+
+
+# --- index ---
+class PreviewIndex:
+    def __init__(self, config, rows=PREVIEW_ROWS):
+        self.config = config
+        self.rows = rows
+        self.output_dir = config.ui_dir
+        self.manifest_file = self.output_dir / MANIFEST_FILE
+        self.shard_dir = self.output_dir / SHARD_DIR
+
+    def load_cache(self):
+        # path -> previous manifest entry. A files.json from before the shard layout
+        # (previews inline, no hashes or shard paths) simply misses the cache.
+        try:
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {(category, entry['path']): entry
+                for category, entries in manifest.items() if isinstance(entries, list)
+                for entry in entries if isinstance(entry, dict) and 'sha256' in entry}
+
+    def cached(self, previous, size, mtime_ns, path):
+        # (sha256 or None if not hashed yet, previous entry if its shard is still valid else None)
+        if previous is None:
+            return None, None
+        shard = shard_name(previous['sha256'], self.rows)
+        if previous.get('preview_shard') != f"{SHARD_DIR}/{shard}" or not (self.shard_dir / shard).exists():
+            return None, None
+        if (previous.get('size'), previous.get('mtime_ns')) == (size, mtime_ns):
+            return previous['sha256'], previous
+        sha256 = hash_table(path)
+        return sha256, previous if sha256 == previous['sha256'] else None
+
+    @timed()
+    def build_entry(self, category, root, path, cache):
+        relative = path.relative_to(root).as_posix()
+        size, mtime_ns = stat_table(path)
+        sha256, previous = self.cached(cache.get((category, relative)), size, mtime_ns, path)
+        if previous is not None:
+            METRICS.count('previews_reused')
+            sheets = previous.get('sheets')
+        else:
+            sha256 = sha256 or hash_table(path)
+            shard = self.shard_dir / shard_name(sha256, self.rows)
+            if shard.exists():
+                # Same content as another listed file (a workbook uploaded twice, a csv copy)
+                with open(shard, 'r') as f:
+                    preview = json.load(f)
+                METRICS.count('previews_reused')
+            else:
+                preview = self.read_preview(path)
+                self.write_shard(shard.name, preview)
+                METRICS.count('previews_built')
+            sheets = list(preview['sheets']) if preview['type'] == 'multi' else None
+        entry = {
+            'name': path.name,
+            'path': relative,
+            'folder': '' if path.parent == root else path.parent.relative_to(root).as_posix(),
+            'size': size,
+            'modified': datetime.datetime.fromtimestamp(mtime_ns / 1e9).strftime('%Y-%m-%d %H:%M:%S'),
+            'mtime_ns': mtime_ns,
+            'sha256': sha256,
+            'preview_shard': f"{SHARD_DIR}/{shard_name(sha256, self.rows)}",
+        }
+        if sheets is not None:
+            entry['sheets'] = sheets
+        return entry
+
+    def read_preview(self, path):
+        suffix = '.parquet' if path.is_dir() else path.suffix
+        try:
+            with METRICS.timer(f"PreviewIndex.read{suffix}"):
+                return READERS[suffix](path, self.rows)
+        except Exception as e:
+            # One unreadable upload shouldn't take the Files view down with it
+            print(f"Warning: no preview for {path}: {e}")
+            return {'type': 'single', 'columns': [], 'rows': [], 'error': str(e)}
+
+    def write_shard(self, name, preview):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        tmp = self.shard_dir / f".{name}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(preview, f, separators=(',', ':'))
+        os.replace(tmp, self.shard_dir / name)
+
+    def run(self):
+        cache = self.load_cache()
+        manifest = {}
+        for category, root in categories(self.config).items():
+            root = Path(root)
+            tables = list_tables(root) if root.is_dir() else []
+            manifest[category] = [self.build_entry(category, root, path, cache) for path in tables]
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp = self.manifest_file.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_file)
+
+        # Shards no entry points at any more (deleted or rewritten files)
+        live = {entry['preview_shard'].rsplit('/', 1)[1] for entries in manifest.values() for entry in entries}
+        for shard in self.shard_dir.glob("*.json") if self.shard_dir.is_dir() else []:
+            if shard.name not in live:
+                shard.unlink()
+
+        n = sum(len(entries) for entries in manifest.values())
+        print(f"Preview index: {n} files -> {self.manifest_file}")
+        return manifest
@@ -0,0 +1,344 @@
+import os
+from pathlib import Path
+
+from .config import arrow_handoff, arrow_path
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# Physical column types for the Parquet tables the phases exchange. Low-cardinality
+# strings are stored as categoricals (Parquet dictionary encoding, read back as pandas
+# categoricals, so groupbys/filters work on integer codes) and ISO strings as timestamps.
+CATEGORIES = {
+    'study': [],
+    'site': ['Country', 'Region'],
+    'subject': ['SubjectStatus'],
+    'visit': ['VisitName'],
+    'form': ['FormName'],
+    'query': ['QueryStatus', 'MarkingGroup'],
+    'lab': ['TestName', 'LabCategory', 'IssueType'],
+    'safety': ['CaseStatus', 'ReviewStatus'],
+    'coding': ['Dictionary', 'CodingStatus'],
+    'inactivation': ['Folder', 'Form', 'AuditAction'],
+    'provenance': ['study_id', 'source_file', 'canonical_entity'],
+    'signals': ['signal_name', 'domain', 'entity_type', 'study_id', 'severity_level'],
+}
+
+TIMESTAMPS = {
+    'visit': ['ProjectedDate'],
+    'query': ['OpenDate', 'ResponseDate'],
+    'lab': ['LabDate'],
+    'provenance': ['ingestion_timestamp'],
+    'signals': ['signal_timestamp'],
+}
+
+# Signal evidence lives in a flat (signal_id, trace_id) edge table next to signals.parquet,
+# sorted by signal_id so each row group covers a contiguous signal_id range
+SIGNAL_TRACES_FILE = "signal_traces.parquet"
+TRACE_COLUMNS = ['signal_id', 'trace_id']
+TRACE_ROW_GROUP = 64_000
+
+
+def apply_schema(name, df):
+    # Cast the known columns of table `name`; unknown tables/columns pass through
+    if df is None or df.empty:
+        return df
+    casts = {}
+    for col in CATEGORIES.get(name, []):
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            casts[col] = df[col].astype('category')
+    for col in TIMESTAMPS.get(name, []):
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            casts[col] = pd.to_datetime(df[col], errors='coerce')
+    return df.assign(**casts) if casts else df
+
+
+# Storage layout. Tables in PARTITIONS are written as Hive-partitioned datasets: the
+# `<name>.parquet` path is a directory of `study_id=<v>/.../part-0.parquet` files (the
+# partition columns live in the directory names only) plus a `_common_metadata` file with
+# the full schema, so a per-study read only opens that study's files. Every table is
+# sorted by its partition columns then SORT_KEYS (stable, so ties keep their order) and
+# written in ROW_GROUP_SIZE row groups with column and page statistics, which lets filters
+# on the sort keys skip row groups. Canonical entity tables (query, form, ...) carry no
+# study or subject column and are clustered by subject in subject_store.cluster_by_subject.
+PARTITIONS = {
+    'provenance': ['study_id'],
+    'signals': ['study_id', 'domain'],
+    'ranked_subjects': ['study_id'],
+    'ranked_sites': ['study_id'],
+}
+
+SORT_KEYS = {
+    'study': ['StudyID'],
+    'site': ['SiteID'],
+    'subject': ['SubjectID'],
+    'provenance': ['source_file', 'source_row_number'],
+    'signals': ['entity_type', 'entity_id'],
+}
+
+ROW_GROUP_SIZE = 16_384
+COMMON_METADATA = "_common_metadata"
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def sort_table(name, df):
+    # Row order of table `name` on disk. Callers that keep using the frame in memory (the
+    # hand-off to the next phase, row-position indexes) sort with this before writing.
+    if df is None or df.empty:
+        return df
+    keys = [c for c in PARTITIONS.get(name, []) + SORT_KEYS.get(name, []) if c in df.columns]
+    if not keys:
+        return df
+    # Categoricals sort by value, like the partition directories, not by category code
+    return df.sort_values(keys, kind='stable', ignore_index=True,
+                          key=lambda s: s.astype(object) if isinstance(s.dtype, pd.CategoricalDtype) else s)
+
+
+def partition_dir(column, value):
+    from urllib.parse import quote
+    return f"{column}={NULL_PARTITION if value is None else quote(str(value), safe=' ')}"
+
+
+def partition_value(part):
+    # (column, value) of a `column=value` directory name; None for the null partition
+    from urllib.parse import unquote
+    column, _, value = part.partition('=')
+    return column, None if value == NULL_PARTITION else unquote(value)
+
+
+def split_filters(path, filters):
+    # (partition filters, file filters). Only == / in can be used on partition columns.
+    columns = set(partition_columns(path))
+    partition, rest = {}, []
+    for column, op, value in filters or []:
+        if column not in columns:
+            rest.append((column, op, value))
+        elif op in ('=', '=='):
+            partition[column] = {None if value is None else str(value)}
+        elif op == 'in':
+            partition[column] = {None if v is None else str(v) for v in value}
+        else:
+            raise ValueError(f"Only == / in filters can be used on partition column {column}")
+    return partition, rest or None
+
+
+def partition_columns(path):
+    # Partition columns of a dataset, outermost first, from its first directory chain
+    columns, directory = [], Path(path)
+    while directory.is_dir():
+        directory = next((d for d in directory.iterdir() if d.is_dir() and '=' in d.name), None)
+        if directory is None:
+            break
+        columns.append(partition_value(directory.name)[0])
+    return columns
+
+
+def dataset_files(path, filters=None):
+    # [(file, {partition column: value})] of table `path` in row order: the file itself,
+    # or the dataset's files ordered by partition value (nulls last, like sort_table).
+    # == / in filters on partition columns prune whole directories here.
+    path = Path(path)
+    if not path.is_dir():
+        return [(path, {})]
+    wanted, _ = split_filters(path, filters)
+
+    def walk(directory, values):
+        files = [(p, values) for p in sorted(directory.glob("*.parquet")) if p.is_file()]
+        parts = []
+        for sub in directory.iterdir():
+            if sub.is_dir() and '=' in sub.name:
+                column, value = partition_value(sub.name)
+                if column not in wanted or value in wanted[column]:
+                    parts.append(((value is None, value or ''), sub, {**values, column: value}))
+        for _, sub, sub_values in sorted(parts, key=lambda p: p[0]):
+            files.extend(walk(sub, sub_values))
+        return files
+
+    return walk(path, {})
+
+
+def with_partitions(table, values, schema):
+    # A file's columns plus its partition values, as `schema` (the dataset's full schema)
+    import pyarrow as pa
+
+    columns = []
+    for field in schema:
+        if field.name in values:
+            value = values[field.name]
+            column = (pa.nulls(len(table), field.type) if value is None
+                      else pa.array([value] * len(table), pa.string()).cast(field.type))
+        else:
+            column = table.column(field.name)
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def parquet_options(name, table, **options):
+    # Row-group size, statistics and (for sorted tables) the sort order in the file footer
+    import pyarrow.parquet as pq
+
+    options.setdefault('row_group_size', ROW_GROUP_SIZE)
+    options.setdefault('write_statistics', True)
+    options.setdefault('write_page_index', True)
+    keys = [c for c in PARTITIONS.get(name, []) + SORT_KEYS.get(name, []) if c in table.column_names]
+    if keys and 'sorting_columns' not in options:
+        options['sorting_columns'] = [pq.SortingColumn(table.column_names.index(c)) for c in keys]
+    return options
+
+
+def remove_path(path):
+    # A table is either a file or a dataset directory
+    import shutil
+
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+# Opt-in hand-off format: with PIPELINE_ARROW_HANDOFF=1 every table written through
+# write_table also gets an uncompressed Arrow IPC (Feather v2) copy next to its Parquet
+# file. Readers memory-map that copy instead of decompressing the Parquet, so processes
+# reading the same table share its pages in the OS cache. Parquet stays the durable format:
+# the copies are derived files (sync_arrow_copy), not outputs of the phase that wrote them.
+def write_table(df, path, name=None, **options):
+    # Parquet file, or partitioned dataset when `name` is in PARTITIONS, in sort_table order
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    if name is not None:
+        df = sort_table(name, df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Written next to the old version and swapped in, so readers never see half a dataset
+    tmp = path.with_name(f".{path.name}.tmp")
+    remove_path(tmp)
+
+    columns = [c for c in PARTITIONS.get(name, []) if c in df.columns]
+    if not columns:
+        pq.write_table(table, tmp, **parquet_options(name, table, **options))
+    else:
+        tmp.mkdir(parents=True)
+        pq.write_metadata(table.schema, tmp / COMMON_METADATA)
+        data = table.drop_columns(columns)
+        file_options = parquet_options(name, data, **options)
+        if df.empty:
+            # No partitions: one empty file with the full schema
+            pq.write_table(table, tmp / "part-0.parquet", **parquet_options(name, table, **options))
+        # Sorted by the partition columns, so each partition is one contiguous slice
+        groups = df.groupby(columns, sort=False, dropna=False, observed=True).indices
+        for key, rows in groups.items():
+            key = key if isinstance(key, tuple) else (key,)
+            part = tmp.joinpath(*(partition_dir(c, None if pd.isna(v) else v) for c, v in zip(columns, key)))
+            part.mkdir(parents=True)
+            pq.write_table(data.slice(rows[0], len(rows)), part / "part-0.parquet", **file_options)
+    remove_path(path)
+    os.replace(tmp, path)
+
+    if arrow_handoff():
+        feather.write_feather(table, arrow_path(path), compression='uncompressed')
+    else:
+        # A copy left from an earlier run would no longer match the Parquet file
+        arrow_path(path).unlink(missing_ok=True)
+
+
+def arrow_copy_current(path):
+    # The Arrow copy exists and is at least as new as the Parquet file/dataset
+    ipc = arrow_path(path)
+    return ipc.exists() and (not path.exists() or ipc.stat().st_mtime_ns >= path.stat().st_mtime_ns)
+
+
+def sync_arrow_copy(path, create=True):
+    # Brings the Arrow copy of an existing Parquet table in line with the hand-off setting,
+    # without rewriting the Parquet: derived from it when the hand-off is on and the copy is
+    # missing or stale (unless `create` is False), removed when off or stale. True if written.
+    # Only stats files until a copy is written, so cached runs don't import pyarrow.
+    path = Path(path)
+    if arrow_handoff() and path.exists() and arrow_copy_current(path):
+        return False
+    arrow_path(path).unlink(missing_ok=True)
+    if not (create and arrow_handoff() and path.exists()):
+        return False
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    table = pa.Table.from_pandas(read_frame(path), preserve_index=False)
+    feather.write_feather(table, arrow_path(path), compression='uncompressed')
+    return True
+
+
+def read_frame(path, filters=None):
+    # The memory-mapped Arrow copy when it is at least as new as the Parquet file/dataset
+    # (other writers, e.g. the DuckDB backend, only rewrite the Parquet), else the Parquet.
+    # split_blocks keeps numeric columns without nulls as views on the mapped pages.
+    # `filters` ([(column, op, value)], e.g. [('study_id', '==', '14')]) always read the
+    # Parquet: partition directories are pruned, then row groups by their statistics.
+    path = Path(path)
+    if filters is None and arrow_copy_current(path):
+        import pyarrow as pa
+        table = pa.ipc.open_file(pa.memory_map(str(arrow_path(path)))).read_all()
+        return table.to_pandas(split_blocks=True)
+    if not path.is_dir():
+        return pd.read_parquet(path, filters=filters)
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(path / COMMON_METADATA)
+    _, file_filters = split_filters(path, filters)
+    tables = [with_partitions(pq.read_table(f, filters=file_filters), values, schema)
+              for f, values in dataset_files(path, filters)]
+    return (pa.concat_tables(tables) if tables else schema.empty_table()).to_pandas()
+
+
+def read_rows(path, positions):
+    # Rows at `positions` (sorted row numbers) of a table, reading only the row groups
+    # that contain them. Returns (frame, total rows of the table).
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    positions = np.asarray(positions, dtype=np.int64)
+    schema = pq.read_schema(path / COMMON_METADATA) if path.is_dir() else None
+    pieces, base = [], 0
+    for f, values in dataset_files(path):
+        pf = pq.ParquetFile(f)
+        for group in range(pf.metadata.num_row_groups):
+            n = pf.metadata.row_group(group).num_rows
+            lo, hi = np.searchsorted(positions, [base, base + n])
+            if hi > lo:
+                piece = pf.read_row_group(group).take(positions[lo:hi] - base)
+                pieces.append(with_partitions(piece, values, schema) if schema is not None else piece)
+            base += n
+        if schema is None:
+            schema = pf.schema_arrow
+    if schema is None:
+        return pd.DataFrame(), 0
+    table = pa.concat_tables(pieces) if pieces else schema.empty_table()
+    return table.to_pandas(), base
+
+
+def read_table(path, name, filters=None):
+    # Files written by apply_schema come back typed as-is; older untyped files are cast on read
+    return apply_schema(name, read_frame(path, filters))
+
+
+def read_signals(path, filters=None):
+    # (signals, signal_traces) for a signals.parquet file. Files written before the edge
+    # table existed carry a list-valued trace_ids column, which is split off here.
+    path = Path(path)
+    signals = read_table(path, 'signals', filters)
+    traces_path = path.with_name(SIGNAL_TRACES_FILE)
+    if traces_path.exists():
+        traces = read_frame(traces_path)
+        if filters is not None:
+            traces = traces[traces['signal_id'].isin(signals['signal_id'])].reset_index(drop=True)
+    elif 'trace_ids' in signals.columns:
+        traces = (signals[['signal_id', 'trace_ids']].explode('trace_ids')
+                  .rename(columns={'trace_ids': 'trace_id'})
+                  .dropna().reset_index(drop=True))
+    else:
+        traces = pd.DataFrame(columns=TRACE_COLUMNS)
+    return signals.drop(columns=['trace_ids'], errors='ignore'), traces
@@ -0,0 +1,156 @@
+import sys
+from pathlib import Path
+
+from .dag import Pipeline, Stage
+
+# The phase folders are imported as namespace packages (Phase_2_Ingestion.ingest_studies, ...)
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+
+def sync_handoff(tables, create=True):
+    # Stage `derive` hook: Arrow copies of the Parquet tables a stage wrote follow the
+    # --arrow-handoff setting (schema.sync_arrow_copy), so turning it on or off never
+    # re-runs a stage; cached stages just gain or lose their copies.
+    from .schema import sync_arrow_copy
+    for path in tables:
+        sync_arrow_copy(path, create)
+
+
+# --- ingest: Phase 2 ---
+def run_ingest(config, upstream):
+    from Phase_2_Ingestion import ingest_studies
+    ingest_studies.setup_logging(config.base_dir / "Phase_2_Ingestion/phase2_ingestion.log")
+    engine = ingest_studies.IngestionEngine(source_dir=config.source_dir, canonical_dir=config.canonical_dir,
+                                            schema_path=config.schema_file)
+    return engine.run()
+
+def ingest_inputs(config):
+    return [config.source_dir, config.schema_file, ROOT_DIR / "Phase_2_Ingestion/ingest_studies.py"]
+
+def ingest_outputs(config):
+    return [config.canonical_dir / f"{t}.parquet" for t in ['subject', 'provenance']]
+
+def ingest_derive(config):
+    sync_handoff(sorted(config.canonical_dir.glob("*.parquet")))
+
+
+# --- signals: Phase 3 ---
+def backend_options(config):
+    options = {'temp_dir': config.spill_dir}
+    if config.memory_limit:
+        options['memory_limit'] = config.memory_limit
+    return options
+
+def backend_params(config):
+    # Switching backends re-runs signals and dqi even though no input file changed
+    return {'backend': config.backend}
+
+def run_signals(config, upstream):
+    if config.backend == 'duckdb':
+        # Reads the canonical Parquet files ingest just wrote; returns None (nothing in memory)
+        from Phase_3_Risk_Signals import compute_signals_duckdb
+        engine = compute_signals_duckdb.DuckDBSignalEngine(
+            canonical_dir=config.canonical_dir, output_dir=config.signal_dir, **backend_options(config)
+        )
+        return engine.run_all()
+
+    from Phase_3_Risk_Signals import compute_signals
+    engine = compute_signals.SignalEngine(
+        tables=upstream['ingest'], canonical_dir=config.canonical_dir, output_dir=config.signal_dir
+    )
+    signals = engine.run_all()
+    return {'signals': signals, 'signal_traces': engine.trace_frame}
+
+def signals_inputs(config):
+    return [ROOT_DIR / "Phase_3_Risk_Signals/compute_signals.py", ROOT_DIR / "Phase_3_Risk_Signals/compute_signals_duckdb.py"]
+
+def signals_outputs(config):
+    return [config.signal_dir / "signals.parquet", config.signal_dir / "signal_traces.parquet"]
+
+def signals_derive(config):
+    # DuckDB writes Parquet only; deriving copies would load every signal into memory
+    sync_handoff(signals_outputs(config), create=config.backend != 'duckdb')
+
+
+# --- dqi: Phase 4 ---
+def run_dqi(config, upstream):
+    if config.backend == 'duckdb':
+        from Phase_4_Aggregation import compute_dqi_duckdb
+        engine = compute_dqi_duckdb.DuckDBDQIEngine(
+            signal_file=config.signal_dir / "signals.parquet",
+            output_dir=config.dqi_dir,
+            config_file=config.weights_file,
+            **backend_options(config),
+        )
+        return engine.run()
+
+    from Phase_4_Aggregation import compute_dqi
+    engine = compute_dqi.DQIEngine(
+        signals=upstream['signals']['signals'] if upstream['signals'] else None,
+        signal_file=config.signal_dir / "signals.parquet",
+        output_dir=config.dqi_dir,
+        config_file=config.weights_file,
+    )
+    return engine.run()
+
+def dqi_inputs(config):
+    return [config.weights_file, ROOT_DIR / "Phase_4_Aggregation/compute_dqi.py",
+            ROOT_DIR / "Phase_4_Aggregation/compute_dqi_duckdb.py"]
+
+def dqi_outputs(config):
+    return [config.dqi_dir / "ranked_subjects.csv", config.dqi_dir / "ranked_subjects.parquet"]
+
+def dqi_derive(config):
+    sync_handoff(sorted(config.dqi_dir.glob("*.parquet")))
+
+
+# --- index: Phase 9 ---
+def run_index(config, upstream):
+    from Phase_9_GenAI import build_index
+    tables = upstream['ingest']
+    signals = upstream['signals'] or {}
+    return build_index.build_index(
+        signals_df=signals.get('signals'),
+        prov_df=tables.get('provenance') if tables else None,
+        traces_df=signals.get('signal_traces'),
+        signals_path=config.signal_dir / "signals.parquet",
+        provenance_path=config.canonical_dir / "provenance.parquet",
+        output_path=config.index_path,
+    )
+
+def index_inputs(config):
+    return [ROOT_DIR / "Phase_9_GenAI/build_index.py"]
+
+def index_outputs(config):
+    return [config.index_path]
+
+
+# --- previews: Files view index ---
+def run_previews(config, upstream):
+    # Lists whatever is on disk; unchanged files keep their shards
+    from .previews import PreviewIndex
+    PreviewIndex(config).run()
+
+def previews_inputs(config):
+    # No deps: the listed folders are the inputs, so `--stages previews` after an upload
+    # only re-indexes, and a full run (previews last) picks up the fresh phase outputs
+    from .previews import categories
+    return list(categories(config).values()) + [ROOT_DIR / "pipeline/previews.py"]
+
+def previews_outputs(config):
+    from .previews import MANIFEST_FILE
+    return [config.ui_dir / MANIFEST_FILE]
+
+
+def build_pipeline():
+    return Pipeline([
+        Stage('ingest', run_ingest, inputs=ingest_inputs, outputs=ingest_outputs, derive=ingest_derive),
+        Stage('signals', run_signals, deps=['ingest'], inputs=signals_inputs, outputs=signals_outputs,
+              derive=signals_derive, params=backend_params),
+        Stage('dqi', run_dqi, deps=['signals'], inputs=dqi_inputs, outputs=dqi_outputs, derive=dqi_derive,
+              params=backend_params),
+        Stage('index', run_index, deps=['ingest', 'signals'], inputs=index_inputs, outputs=index_outputs),
+        Stage('previews', run_previews, inputs=previews_inputs, outputs=previews_outputs),
+    ])
@@ -0,0 +1,176 @@
+import os
+from pathlib import Path
+
+from .lazy import lazy_import
+from .schema import apply_schema, read_rows, read_table, sort_table
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Canonical tables a subject drill-down needs. Their rows only reach a subject through
+# provenance: the Subject trace written from the same (study, file, row).
+ENTITY_TABLES = ['query', 'form', 'visit', 'lab', 'safety', 'coding', 'inactivation']
+ROW_KEY = ['study_id', 'source_file', 'source_row_number']
+
+INDEX_FILE = "subject_index.npz"
+SIGNAL_INDEX_FILE = "subject_signal_index.npz"
+
+
+def trace_subject_map(provenance):
+    # trace_id -> SubjectID for every trace that shares a source row with a Subject trace
+    if provenance is None or provenance.empty:
+        return pd.Series(dtype=object)
+    subj_rows = (
+        provenance.loc[provenance['canonical_entity'] == 'Subject', ROW_KEY + ['entity_id']]
+        .drop_duplicates(subset=ROW_KEY)
+    )
+    linked = provenance[['trace_id'] + ROW_KEY].merge(subj_rows, on=ROW_KEY, how='inner')
+    return linked.drop_duplicates(subset='trace_id').set_index('trace_id')['entity_id']
+
+
+def csr(codes, n_subjects):
+    # codes[i] = subject position of row i (-1 = no subject). Returns (indptr, indices) so
+    # subject s owns rows indices[indptr[s]:indptr[s + 1]] (row order preserved).
+    codes = np.asarray(codes)
+    rows = np.flatnonzero(codes >= 0)
+    rows = rows[np.argsort(codes[rows], kind='stable')]
+    counts = np.bincount(codes[rows], minlength=n_subjects)
+    indptr = np.zeros(n_subjects + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, rows.astype(np.int64)
+
+
+def subject_codes(subject_ids, values):
+    return pd.Categorical(values, categories=subject_ids).codes.astype(np.int64)
+
+
+def save_index(path, subject_ids, offsets, nrows):
+    arrays = {'subject_ids': np.asarray(subject_ids, dtype=str)}
+    for name, (indptr, indices) in offsets.items():
+        arrays[f"{name}__indptr"] = indptr
+        arrays[f"{name}__indices"] = indices
+        arrays[f"{name}__nrows"] = np.array([nrows[name]], dtype=np.int64)
+    os.makedirs(Path(path).parent, exist_ok=True)
+    np.savez(path, **arrays)
+
+
+def cluster_by_subject(tables):
+    # Storage order of the canonical tables: entity rows grouped by the subject that owns
+    # them (SubjectIDs are study-prefixed, so by study as well; rows without a subject
+    # last, ties in their original order), everything else by schema.sort_table. A
+    # subject's rows are then one contiguous range, i.e. one or two row groups on disk.
+    to_subject = trace_subject_map(tables.get('provenance'))
+    ordered = {}
+    for name, df in tables.items():
+        if name in ENTITY_TABLES and df is not None and not df.empty and 'trace_id' in df.columns:
+            subject = pd.Series(df['trace_id'].map(to_subject).to_numpy(dtype=object))
+            df = df.iloc[subject.sort_values(kind='stable', na_position='last').index].reset_index(drop=True)
+        ordered[name] = sort_table(name, df)
+    return ordered
+
+
+def build_subject_index(tables, path):
+    # Called at the end of ingestion: CSR offsets from each subject into every entity table
+    subjects = tables.get('subject', pd.DataFrame())
+    if subjects.empty:
+        return None
+    subject_ids = pd.Index(subjects['SubjectID'].dropna().astype(str).unique())
+    to_subject = trace_subject_map(tables.get('provenance'))
+
+    offsets, nrows = {}, {}
+    for name in ENTITY_TABLES:
+        df = tables.get(name)
+        if df is None or df.empty or 'trace_id' not in df.columns:
+            continue
+        codes = subject_codes(subject_ids, df['trace_id'].map(to_subject))
+        offsets[name] = csr(codes, len(subject_ids))
+        nrows[name] = len(df)
+    save_index(path, subject_ids, offsets, nrows)
+    return path
+
+
+def build_signal_index(signals, traces, provenance, path):
+    # Called after Phase 3: subject-level signals by entity_id, everything else through
+    # the subject that owns the signal's first trace (first edge in signal_traces)
+    if signals is None or signals.empty:
+        return None
+    first_trace = signals['signal_id'].map(traces.drop_duplicates(subset='signal_id').set_index('signal_id')['trace_id'])
+    subject = signals['entity_id'].where(signals['entity_type'] == 'Subject',
+                                         first_trace.map(trace_subject_map(provenance)))
+    subject_ids = pd.Index(subject.dropna().astype(str).unique())
+    codes = subject_codes(subject_ids, subject)
+    save_index(path, subject_ids, {'signals': csr(codes, len(subject_ids))}, {'signals': len(signals)})
+    return path
+
+
+class SubjectStore:
+    # Read side: one dict lookup plus an array slice per table, no joins.
+    #   store = SubjectStore(canonical_dir, signal_dir)
+    #   store.get("Study_10_Subject 3507")  -> {'query': DataFrame, ..., 'signals': DataFrame}
+    def __init__(self, canonical_dir, signal_dir=None):
+        self.paths = {}
+        self.indexes = []
+        self.tables = {}
+        self.load_index(Path(canonical_dir) / INDEX_FILE, canonical_dir)
+        if signal_dir is not None and (Path(signal_dir) / SIGNAL_INDEX_FILE).exists():
+            self.load_index(Path(signal_dir) / SIGNAL_INDEX_FILE, signal_dir, table_file={'signals': 'signals.parquet'})
+
+    def load_index(self, index_path, data_dir, table_file=None):
+        with np.load(index_path) as npz:
+            arrays = {k: npz[k] for k in npz.files}
+        subject_ids = arrays.pop('subject_ids')
+        positions = {sid: i for i, sid in enumerate(subject_ids.tolist())}
+        offsets = {}
+        for key in arrays:
+            name, part = key.split('__')
+            offsets.setdefault(name, {})[part] = arrays[key]
+        for name, parts in offsets.items():
+            fname = (table_file or {}).get(name, f"{name}.parquet")
+            self.paths[name] = (Path(data_dir) / fname, int(parts['nrows'][0]))
+        self.indexes.append((positions, offsets))
+
+    @property
+    def subject_ids(self):
+        return list(self.indexes[0][0]) if self.indexes else []
+
+    def table(self, name):
+        # Tables are read on first use and kept in memory for later lookups
+        if name not in self.tables:
+            path, nrows = self.paths[name]
+            df = read_table(path, name)
+            if len(df) != nrows:
+                raise ValueError(f"{path.name} has {len(df)} rows but the subject index expects {nrows}; "
+                                 f"re-run ingestion/signals to rebuild it")
+            self.tables[name] = df
+        return self.tables[name]
+
+    def rows(self, subject_id, name):
+        # Row positions of `subject_id` in table `name` (empty if unknown)
+        for positions, offsets in self.indexes:
+            if name in offsets:
+                pos = positions.get(subject_id)
+                if pos is None:
+                    return np.empty(0, dtype=np.int64)
+                indptr, indices = offsets[name]['indptr'], offsets[name]['indices']
+                return indices[indptr[pos]:indptr[pos + 1]]
+        raise KeyError(name)
+
+    def get(self, subject_id, tables=None):
+        # Slices of the tables already in memory; the others are read row-group by row-group,
+        # only the groups that hold the subject's rows
+        out = {}
+        for name in tables or self.paths:
+            rows = self.rows(subject_id, name)
+            if name in self.tables:
+                out[name] = self.tables[name].iloc[rows]
+                continue
+            path, nrows = self.paths[name]
+            df, total = read_rows(path, rows)
+            if total != nrows:
+                raise ValueError(f"{path.name} has {total} rows but the subject index expects {nrows}; "
+                                 f"re-run ingestion/signals to rebuild it")
+            out[name] = apply_schema(name, df).set_axis(rows)
+        return out
+
+    def __contains__(self, subject_id):
+        return any(subject_id in positions for positions, _ in self.indexes)
@@ -0,0 +1,205 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from Phase_2_Ingestion.ingest_studies import SHEETS
+
+# Shape of one synthetic study at scale 1. Rows per routed sheet are roughly the
+# per-study averages of the 23 shipped studies, so scale 1 is about the size of
+# the real dataset and scale 10 / 100 extrapolate from it.
+BASE_STUDIES = 23
+ROWS_PER_STUDY = {
+    "EDC_Metrics": 260,
+    "EDRR": 40,
+    "MedDRA": 2900,
+    "WHODrug": 2950,
+    "Inactivated_Records": 2900,
+    "Lab_Discrepancies": 900,
+    "Missing_Pages": 270,
+    "Visit_Projection": 130,
+    "SAE_Dashboard": 900,
+}
+SUBJECTS_PER_STUDY = 60
+SITES_PER_STUDY = 10
+
+COUNTRIES = ["USA", "FRA", "DEU", "GBR", "BFA", "GAB", "JPN", "BRA"]
+REGIONS = ["AMERICA", "EMEA", "ASIA"]
+VISITS = ["SCREENING", "WEEK4", "WEEK8", "WEEK12", "WEEK24", "EOS"]
+FOLDERS = ["Screening", "Inpatient Treatment/Day 1", "Outpatient FUP 6/Day 29", "EOS Part A"]
+TODAY = pd.Timestamp("2025-11-14")
+
+
+def pick(rng, values, n, p=None):
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=p)]
+
+
+def study_frames(study_num, rows_factor=1.0, seed=0):
+    # One DataFrame per file type, with the columns the real exports carry
+    rng = np.random.default_rng(seed * 100003 + study_num)
+    study = f"Study {study_num}"
+    sites = np.array([f"Site {study_num * 100 + i}" for i in range(SITES_PER_STUDY)], dtype=object)
+    subjects = np.array([f"Subject {study_num * 1000 + i}" for i in range(SUBJECTS_PER_STUDY)], dtype=object)
+    country_of = pick(rng, COUNTRIES, SITES_PER_STUDY)
+
+    def n_rows(kind):
+        return max(int(ROWS_PER_STUDY[kind] * rows_factor), 1)
+
+    def subject_cols(n):
+        idx = rng.integers(0, SUBJECTS_PER_STUDY, size=n)
+        site_idx = idx % SITES_PER_STUDY
+        return subjects[idx], sites[site_idx], country_of[site_idx]
+
+    def days_ago(n, max_days):
+        return TODAY - pd.to_timedelta(rng.integers(0, max_days, size=n), unit="D")
+
+    frames = {}
+
+    n = n_rows("EDC_Metrics")
+    subj, site, country = subject_cols(n)
+    open_date = days_ago(n, 120)
+    frames["EDC_Metrics"] = pd.DataFrame({
+        "Study": study,
+        "Region": pick(rng, REGIONS, n),
+        "Country": country,
+        "Site Number": site,
+        "Subject Name": subj,
+        "Folder Name": pick(rng, FOLDERS, n),
+        "Form": pick(rng, ["Form1", "Form2", "Form3"], n),
+        "Field OID": pick(rng, ["AETERM", "HAPTOG_LBVALUE", "RETI_LBVALUE", "VSORRES"], n),
+        "Log #": np.arange(n),
+        "Visit Date": days_ago(n, 200),
+        "Query Status": pick(rng, ["Answered", "Open", "Closed"], n, p=[0.5, 0.45, 0.05]),
+        "Action Owner": pick(rng, ["DM Review", "Site Review", "CRA Review"], n),
+        "Marking Group Name": pick(rng, ["Site from System", "Site from DM"], n),
+        "Query Open Date": open_date,
+        "Query Response Date": open_date + pd.to_timedelta(rng.integers(0, 10, size=n), unit="D"),
+        "# Days Since Open": (TODAY - open_date).days,
+        "# Days Since Response": rng.integers(0, 30, size=n),
+    })
+
+    n = n_rows("EDRR")
+    frames["EDRR"] = pd.DataFrame({
+        "Study": study,
+        "Subject": subjects[rng.integers(0, SUBJECTS_PER_STUDY, size=n)],
+        "Total Open issue Count per subject": rng.integers(1, 20, size=n),
+        ".": np.nan,
+    })
+
+    for kind, dictionary, version, form in [("MedDRA", "MedDRA", 28.1, "AEG001"), ("WHODrug", "WHODrug-Global-B3", 202509, "CMG001")]:
+        n = n_rows(kind)
+        frames[kind] = pd.DataFrame({
+            f"{kind} Coding Report": f"{kind} Coding Report",
+            "Study": study,
+            "Dictionary": dictionary,
+            "Dictionary Version number": version,
+            "Subject": subjects[rng.integers(0, SUBJECTS_PER_STUDY, size=n)],
+            "Form OID": form,
+            "Logline": rng.integers(1, 50, size=n),
+            "Field OID": "AETERM" if kind == "MedDRA" else "CMTRT",
+            "Coding Status": pick(rng, ["Coded Term", "UnCoded Term"], n, p=[0.99, 0.01]),
+            "Require Coding": pick(rng, ["No", "Yes"], n, p=[0.95, 0.05]),
+        })
+
+    n = n_rows("Inactivated_Records")
+    subj, site, country = subject_cols(n)
+    position = rng.integers(1, 10, size=n).astype(float)
+    position[rng.random(n) < 0.3] = np.nan
+    frames["Inactivated_Records"] = pd.DataFrame({
+        "Country": country,
+        "Study Site Number": site,
+        "Subject": subj,
+        "Folder": pick(rng, FOLDERS, n),
+        "Form": pick(rng, ["Form 1", "Form 2", "Form 3"], n),
+        "Data on Form/\nRecord    ": pick(rng, ["N", "Y"], n),
+        "RecordPosition": position,
+        "Audit Action": pick(rng, ["Record Inactivated.", "Amendment Manager: DataPage Inactivated."], n),
+    })
+
+    n = n_rows("Lab_Discrepancies")
+    subj, site, country = subject_cols(n)
+    frames["Lab_Discrepancies"] = pd.DataFrame({
+        "Country": country,
+        "Site number": site,
+        "Subject": subj,
+        "Visit": pick(rng, FOLDERS, n),
+        "Form Name": pick(rng, ["Form 1", "Form 2"], n),
+        "Lab category": pick(rng, ["URINALYSIS", "HEMATOLOGY", "CHEMISTRY"], n),
+        "Lab Date": days_ago(n, 90).strftime("%d-%b-%Y").str.upper(),
+        "Test Name": pick(rng, ["USPGRST", "INR", "HGB", "ALT"], n),
+        "Test description": "Synthetic test",
+        "Issue": pick(rng, ["Ranges/ Units not entered", "Missing Lab name"], n),
+        "Comments": "Action for CRA",
+    })
+
+    n = n_rows("Missing_Pages")
+    subj, site, country = subject_cols(n)
+    days_missing = rng.integers(1, 120, size=n).astype(float)
+    days_missing[rng.random(n) < 0.2] = np.nan
+    frames["Missing_Pages"] = pd.DataFrame({
+        "Study Name": study,
+        "SiteGroupName(CountryName)": country,
+        "SiteNumber": site,
+        "SubjectName": subj,
+        "Overall Subject Status": "On Trial",
+        "Visit Level Subject Status": "SUBJECT CONTINUING",
+        "FolderName": pick(rng, FOLDERS, n),
+        "Visit date": days_ago(n, 90).strftime("%d %b %Y").str.upper(),
+        "Form Type (Summary or Visit)": "Visit Level",
+        "FormName": pick(rng, ["Form 1", "Form 2", "Form 3", "Form 4"], n),
+        "No. #Days Page Missing": days_missing,
+    })
+
+    n = n_rows("Visit_Projection")
+    subj, site, country = subject_cols(n)
+    projected = days_ago(n, 60)
+    frames["Visit_Projection"] = pd.DataFrame({
+        "Country": country,
+        "Site": site,
+        "Subject": subj,
+        "Visit": pick(rng, VISITS, n),
+        "Projected Date": projected,
+        "# Days Outstanding": (TODAY - projected).days,
+    })
+
+    n = n_rows("SAE_Dashboard")
+    subj, site, country = subject_cols(n)
+    frames["SAE_Dashboard"] = pd.DataFrame({
+        "Discrepancy ID": study_num * 1_000_000 + np.arange(n),
+        "Study ID": study,
+        "Site": site,
+        "Patient ID": subj,
+        "Case Status": pick(rng, ["Open", "Closed", "Locked"], n),
+        "Discrepancy Created Timestamp in Dashboard": days_ago(n, 300),
+        "Review Status": pick(rng, ["Review Completed", "Pending for Review"], n),
+        "Action Status": pick(rng, ["No action required", "Action required"], n),
+    })
+
+    return frames
+
+
+def sheet_name(kind):
+    # The sheet ingest_studies.SHEETS routes `kind` to; a positional entry is the first sheet
+    sheet = SHEETS[kind]
+    return sheet if isinstance(sheet, str) else "Sheet1"
+
+
+def generate(output_dir, scale=1.0, fmt="xlsx", seed=0, rows_factor=1.0):
+    # Writes Study_N_Input_Files/Study_N_<Type>.xlsx (or .parquet, holding just the
+    # sheet the parser reads) for round(BASE_STUDIES * scale) studies.
+    output_dir = Path(output_dir)
+    n_studies = max(int(round(BASE_STUDIES * scale)), 1)
+    total_rows = 0
+    for study_num in range(1, n_studies + 1):
+        folder = output_dir / f"Study_{study_num}_Input_Files"
+        os.makedirs(folder, exist_ok=True)
+        for kind, df in study_frames(study_num, rows_factor=rows_factor, seed=seed).items():
+            path = folder / f"Study_{study_num}_{kind}.{fmt}"
+            if fmt == "parquet":
+                df.to_parquet(path, index=False)
+            else:
+                df.to_excel(path, sheet_name=sheet_name(kind), index=False)
+            total_rows += len(df)
+    print(f"Generated {n_studies} studies ({total_rows} rows) in {output_dir}")
+    return n_studies, total_rows
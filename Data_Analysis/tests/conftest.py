@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The phase folders and `pipeline` are imported from the Data_Analysis folder
+DATA_ANALYSIS = str(Path(__file__).resolve().parent.parent)
+if DATA_ANALYSIS not in sys.path:
+    sys.path.insert(0, DATA_ANALYSIS)
+
+# Synthetic portfolio the ingest-level tests share: two studies, 5% of the real row counts
+STUDY = {'scale': 2 / 23, 'rows_factor': 0.05, 'seed': 5}
+
+
+@pytest.fixture(scope='session')
+def study(request, tmp_path_factory):
+    # Folder with src/ (synthetic Parquet sources) and canonical/ (their full ingest), built
+    # once per parameter set. Tests that need other data override STUDY keys indirectly:
+    #   @pytest.mark.parametrize('study', [{'scale': 1 / 23, 'seed': 3}], indirect=True)
+    # Tests write their own outputs next to src/ and canonical/ and leave those two alone.
+    from Phase_2_Ingestion.ingest_studies import IngestionEngine
+    from pipeline.synthetic import generate
+
+    options = {**STUDY, **getattr(request, 'param', {})}
+    root = tmp_path_factory.mktemp("study")
+    generate(root / "src", fmt="parquet", **options)
+    IngestionEngine(source_dir=root / "src", canonical_dir=root / "canonical", prefetch=0).run()
+    return root
@@ -0,0 +1,153 @@
+import gzip
+import http.client
+import json
+import threading
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from pipeline.api import kpis, make_server
+from pipeline.schema import write_table
+
+
+def test_kpis_count_subjects_with_open_issues():
+    subjects = pd.DataFrame({
+        'entity_id': ['S1', 'S2', 'S3', 'S4'],
+        'risk_level': ['Critical', 'High', 'Low', 'Low'],
+        'signal_count': [4, 2, 1, 1],
+    })
+    out = kpis(subjects, frozenset({'S2', 'S4', 'S9'}))
+    assert out == {'total_subjects': 4, 'critical_subjects': 1, 'subjects_with_open_issues': 2,
+                   'data_readiness_risk_pct': 50.0}
+
+
+@pytest.fixture
+def server(tmp_path):
+    config = SimpleNamespace(base_dir=tmp_path, canonical_dir=tmp_path / "canonical",
+                             signal_dir=tmp_path / "signals", dqi_dir=tmp_path / "dqi")
+    config.dqi_dir.mkdir()
+    config.canonical_dir.mkdir()
+    server = make_server(config, port=0)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}{path}") as r:
+            return r.status, json.load(r)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_kpis_endpoint(server):
+    config = server.store.config
+    pd.DataFrame({'study_id': ['1', '1'], 'entity_id': ['Study_1_A', 'Study_1_B'], 'risk_level': ['High', 'Low'],
+                  'signal_count': [3, 1], 'dqi_score': [0.9, 0.2]}).to_csv(config.dqi_dir / "ranked_subjects.csv", index=False)
+    assert get(server, "/api/kpis")[0] == 503
+
+    subjects = pd.DataFrame({'SubjectID': ['Study_1_A', 'Study_1_B'], 'OpenIssueCount': [0, 5]})
+    write_table(subjects, config.canonical_dir / "subject.parquet", 'subject')
+    status, body = get(server, "/api/kpis")
+    assert status == 200 and body['total_subjects'] == 2 and body['subjects_with_open_issues'] == 1
+
+
+def test_unexpected_errors_are_json_500s(server):
+    (server.store.config.dqi_dir / "ranked_subjects.parquet").write_bytes(b"not parquet")
+    status, body = get(server, "/api/subjects")
+    assert status == 500 and 'error' in body
+
+
+def fetch(server, path, headers=None):
+    # (status, headers, raw body) without urllib's error handling or decoding
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def ranked(server):
+    # 60 ranked subjects over two studies, as compute_dqi writes them
+    n = 60
+    df = pd.DataFrame({
+        'study_id': [str(1 + i % 2) for i in range(n)],
+        'entity_id': [f"Study_{1 + i % 2}_Subject {i}" for i in range(n)],
+        'total_weighted_risk': [float(n - i) for i in range(n)],
+        'signal_count': [1 + i % 5 for i in range(n)],
+        'dqi_score': [round(1 - i / n, 4) for i in range(n)],
+        'risk_level': ['Critical' if i < 10 else 'Low' for i in range(n)],
+    })
+    write_table(df, server.store.config.dqi_dir / "ranked_subjects.parquet", 'ranked_subjects')
+    return df
+
+
+def test_pagination(server, ranked):
+    status, body = get(server, "/api/subjects?offset=10&limit=5")
+    assert status == 200
+    assert (body['total'], body['offset'], body['limit']) == (60, 10, 5)
+    assert [item['entity_id'] for item in body['items']] == ranked['entity_id'].iloc[10:15].tolist()
+
+    status, body = get(server, "/api/subjects?study_id=2&limit=1000")
+    assert body['total'] == 30 and {item['study_id'] for item in body['items']} == {'2'}
+    assert get(server, "/api/subjects?offset=55&limit=50")[1]['items'][-1]['entity_id'] == ranked['entity_id'].iloc[-1]
+
+
+@pytest.mark.parametrize('query', ["limit=0", "limit=1001", "offset=-1", "offset=abc", "limit=1.5"])
+def test_bad_page_params_are_400s(server, ranked, query):
+    status, body = get(server, f"/api/subjects?{query}")
+    assert status == 400 and 'error' in body
+
+
+def test_etag_round_trip(server, ranked):
+    status, headers, _ = fetch(server, "/api/subjects?limit=5")
+    assert status == 200 and headers['ETag'].startswith('W/"')
+    etag = headers['ETag']
+
+    status, headers, body = fetch(server, "/api/subjects?limit=5", {'If-None-Match': etag})
+    assert status == 304 and body == b'' and headers['ETag'] == etag
+    # Another page or representation is another resource
+    assert fetch(server, "/api/subjects?limit=6", {'If-None-Match': etag})[0] == 200
+    assert fetch(server, "/api/subjects?limit=5&format=arrow", {'If-None-Match': etag})[0] == 200
+
+    # Rewritten outputs get a new tag
+    write_table(ranked.iloc[::-1], server.store.config.dqi_dir / "ranked_subjects.parquet", 'ranked_subjects')
+    status, headers, _ = fetch(server, "/api/subjects?limit=5", {'If-None-Match': etag})
+    assert status == 200 and headers['ETag'] != etag
+
+
+def test_gzip_only_when_accepted(server, ranked):
+    status, headers, body = fetch(server, "/api/subjects?limit=50", {'Accept-Encoding': 'gzip, deflate'})
+    assert status == 200 and headers['Content-Encoding'] == 'gzip'
+    assert int(headers['Content-Length']) == len(body)
+    assert len(json.loads(gzip.decompress(body))['items']) == 50
+
+    status, headers, body = fetch(server, "/api/subjects?limit=50")
+    assert 'Content-Encoding' not in headers and len(json.loads(body)['items']) == 50
+    # Small bodies aren't worth compressing
+    status, headers, body = fetch(server, "/api/subjects?limit=1", {'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in headers and json.loads(body)['total'] == 60
+
+
+@pytest.mark.parametrize('path, headers', [
+    ("/api/subjects?offset=5&limit=7", {'Accept': 'application/vnd.apache.arrow.stream'}),
+    ("/api/subjects?offset=5&limit=7&format=arrow", {}),
+])
+def test_arrow_stream(server, ranked, path, headers):
+    import pyarrow as pa
+
+    status, headers, body = fetch(server, path, headers)
+    assert status == 200 and headers['Content-Type'] == 'application/vnd.apache.arrow.stream'
+    assert headers['X-Total-Count'] == '60'
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.schema.metadata[b'total'] == b'60'
+    assert table.column('entity_id').to_pylist() == ranked['entity_id'].iloc[5:12].tolist()
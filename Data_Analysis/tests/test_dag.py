@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+from pipeline.dag import Pipeline, Stage
+
+
+def chain(tmp_path, calls):
+    # a -> b -> c, each stage writes one file; c has no declared outputs
+    def writer(name):
+        def run(config, upstream):
+            calls.append(name)
+            if name != 'c':
+                (tmp_path / f"{name}.out").write_text(f"{name} {len(calls)}")
+        return run
+
+    source = tmp_path / "source.txt"
+    source.write_text("v1")
+    return Pipeline([
+        Stage('a', writer('a'), inputs=lambda c: [source], outputs=lambda c: [tmp_path / "a.out"]),
+        Stage('b', writer('b'), deps=['a'], outputs=lambda c: [tmp_path / "b.out"]),
+        Stage('c', writer('c'), deps=['b']),
+    ])
+
+
+def test_unchanged_run_is_skipped(tmp_path):
+    calls = []
+    pipeline = chain(tmp_path, calls)
+    config = SimpleNamespace(state_file=tmp_path / "state.json")
+    pipeline.run(config)
+    assert calls == ['a', 'b', 'c']
+    _, summary = pipeline.run(config)
+    assert calls == ['a', 'b', 'c']
+    assert [status for _, status, _ in summary] == ['skipped'] * 3
+
+
+def test_deleted_intermediate_output_reruns_everything_below(tmp_path):
+    calls = []
+    pipeline = chain(tmp_path, calls)
+    config = SimpleNamespace(state_file=tmp_path / "state.json")
+    pipeline.run(config)
+    (tmp_path / "b.out").unlink()
+    calls.clear()
+    pipeline.run(config)
+    assert calls == ['b', 'c']
+    # and the re-run is cached in turn
+    calls.clear()
+    pipeline.run(config)
+    assert calls == []
+
+
+def test_upstream_input_change_reruns_chain(tmp_path):
+    calls = []
+    pipeline = chain(tmp_path, calls)
+    config = SimpleNamespace(state_file=tmp_path / "state.json")
+    pipeline.run(config)
+    (tmp_path / "source.txt").write_text("v2 changed")
+    calls.clear()
+    pipeline.run(config)
+    assert calls == ['a', 'b', 'c']
+
+
+def test_targets_run_only_their_dependencies(tmp_path):
+    calls = []
+    pipeline = chain(tmp_path, calls)
+    config = SimpleNamespace(state_file=tmp_path / "state.json")
+    pipeline.run(config, targets=['b'])
+    assert calls == ['a', 'b']
+
+
+def test_derive_runs_after_skipped_stages_without_rerunning_them(tmp_path):
+    calls, derived = [], []
+    source = tmp_path / "source.txt"
+    source.write_text("v1")
+
+    def run(config, upstream):
+        calls.append('a')
+        (tmp_path / "a.out").write_text("a")
+
+    pipeline = Pipeline([Stage('a', run, inputs=lambda c: [source], outputs=lambda c: [tmp_path / "a.out"],
+                               derive=lambda c: derived.append(c.flag))])
+    config = SimpleNamespace(state_file=tmp_path / "state.json", flag='off')
+    pipeline.run(config)
+    config.flag = 'on'
+    _, summary = pipeline.run(config)
+    assert calls == ['a']
+    assert summary[0][1] == 'skipped'
+    assert derived == ['off', 'on']
+
+
+def test_params_change_reruns_the_stage(tmp_path):
+    calls = []
+    pipeline = Pipeline([
+        Stage('a', lambda c, u: calls.append('a')),
+        Stage('b', lambda c, u: calls.append('b'), deps=['a'], params=lambda c: {'backend': c.backend}),
+    ])
+    config = SimpleNamespace(state_file=tmp_path / "state.json", backend='pandas')
+    pipeline.run(config)
+    pipeline.run(config)
+    config.backend = 'duckdb'
+    pipeline.run(config)
+    assert calls == ['a', 'b', 'b']
+
+
+def test_backend_is_part_of_the_signals_and_dqi_keys(tmp_path):
+    from pipeline.config import PipelineConfig
+    from pipeline.stages import build_pipeline
+
+    pipeline = build_pipeline()
+    keys = {}
+    for backend in ('pandas', 'duckdb'):
+        config = PipelineConfig(tmp_path, backend=backend)
+        # Same upstream keys for both, so only the backend can tell them apart
+        upstream = {'ingest': 'cached', 'signals': 'cached'}
+        keys[backend] = {name: pipeline.fingerprint(pipeline.stages[name], config, upstream)
+                         for name in ('signals', 'dqi')}
+    assert keys['pandas']['signals'] != keys['duckdb']['signals']
+    assert keys['pandas']['dqi'] != keys['duckdb']['dqi']
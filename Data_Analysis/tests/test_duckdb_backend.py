@@ -0,0 +1,108 @@
+import pandas as pd
+import pytest
+
+from Phase_3_Risk_Signals.compute_signals import SignalEngine
+from Phase_4_Aggregation.compute_dqi import DQIEngine
+from pipeline.schema import read_frame, read_table
+from pipeline.subject_store import SubjectStore
+
+pytest.importorskip('duckdb')
+from Phase_3_Risk_Signals.compute_signals_duckdb import DuckDBSignalEngine  # noqa: E402
+from Phase_4_Aggregation.compute_dqi_duckdb import DuckDBDQIEngine  # noqa: E402
+from pipeline.duckdb_backend import connect, copy_partitioned, parquet  # noqa: E402
+
+# Everything but the generated ids and timestamps
+SIGNAL_COLUMNS = ['signal_name', 'domain', 'entity_type', 'entity_id', 'study_id',
+                  'raw_metric_value', 'normalized_score', 'severity_level', 'explanation']
+
+
+@pytest.fixture(scope='module')
+def runs(study):
+    # The same canonical data through both backends: {backend: output root}
+    root = study / "duckdb_backend"
+    canonical_dir = study / "canonical"
+    signals = SignalEngine(canonical_dir=canonical_dir, output_dir=root / "pandas/signals").run_all()
+    DQIEngine(signals=signals, output_dir=root / "pandas/dqi").run()
+    DuckDBSignalEngine(canonical_dir=canonical_dir, output_dir=root / "duckdb/signals").run_all()
+    DuckDBDQIEngine(signal_file=root / "duckdb/signals/signals.parquet", output_dir=root / "duckdb/dqi").run()
+    return {'pandas': root / "pandas", 'duckdb': root / "duckdb"}
+
+
+def signal_rows(signals):
+    rows = signals[SIGNAL_COLUMNS].astype(object).where(signals[SIGNAL_COLUMNS].notna(), None)
+    return rows.sort_values(SIGNAL_COLUMNS, kind='stable').reset_index(drop=True)
+
+
+def traced_signals(signal_dir):
+    # One row per (signal, trace) edge, the signal identified by its content
+    signals = read_table(signal_dir / "signals.parquet", 'signals')
+    traces = pd.read_parquet(signal_dir / "signal_traces.parquet")
+    edges = traces.merge(signals[['signal_id'] + SIGNAL_COLUMNS], on='signal_id')
+    return signal_rows(edges.assign(explanation=edges['explanation'] + "|" + edges['trace_id'].astype(str)))
+
+
+def test_signals_match(runs):
+    pandas_signals = read_table(runs['pandas'] / "signals/signals.parquet", 'signals')
+    duckdb_signals = read_table(runs['duckdb'] / "signals/signals.parquet", 'signals')
+    assert len(pandas_signals) > 0
+    pd.testing.assert_frame_equal(signal_rows(duckdb_signals), signal_rows(pandas_signals))
+    pd.testing.assert_frame_equal(traced_signals(runs['duckdb'] / "signals"), traced_signals(runs['pandas'] / "signals"))
+
+
+def test_ranked_outputs_match(runs):
+    names = sorted(p.name for p in (runs['pandas'] / "dqi").glob("ranked_*.csv"))
+    assert names and names == sorted(p.name for p in (runs['duckdb'] / "dqi").glob("ranked_*.csv"))
+    for name in names:
+        pandas_ranked = pd.read_csv(runs['pandas'] / "dqi" / name).drop(columns='generated_at')
+        duckdb_ranked = pd.read_csv(runs['duckdb'] / "dqi" / name).drop(columns='generated_at')
+        assert len(pandas_ranked) > 0
+        pd.testing.assert_frame_equal(duckdb_ranked, pandas_ranked)
+
+
+def test_signal_index_matches(study, runs):
+    # The DuckDB-built subject_signal_index.npz resolves every subject to the same signals
+    stores = {backend: SubjectStore(study / "canonical", root / "signals") for backend, root in runs.items()}
+    assert set(stores['duckdb'].indexes[1][0]) == set(stores['pandas'].indexes[1][0])
+    for sid in stores['pandas'].indexes[1][0]:
+        got = {backend: store.get(sid, ['signals'])['signals'] for backend, store in stores.items()}
+        assert len(got['pandas']) > 0
+        pd.testing.assert_frame_equal(signal_rows(got['duckdb']), signal_rows(got['pandas']))
+
+
+def test_copy_partitioned_round_trip(tmp_path):
+    con = connect(temp_dir=tmp_path / "spill")
+    # Small flushes make DuckDB write partial row groups late
+    con.execute("SET partitioned_write_flush_threshold = 3000")
+    con.execute("""
+        CREATE TABLE s AS
+        SELECT printf('%08x', i) AS signal_id,
+               CASE WHEN i % 13 = 0 THEN NULL ELSE 'st/' || (i % 4) || ' %' END AS study_id,
+               CASE WHEN i % 2 = 0 THEN 'Safety' ELSE 'Query Health' END AS domain,
+               'Subject' AS entity_type, 'S' || lpad((i * 7919 % 1000)::VARCHAR, 4, '0') AS entity_id,
+               (i * 37 % 100) / 100 AS normalized_score
+        FROM range(20000) t(i)
+    """)
+    path = tmp_path / "signals.parquet"
+    copy_partitioned(con, "SELECT * FROM s", path, 'signals', "study_id, domain, entity_type, entity_id, signal_id",
+                     row_group_size=2048)
+
+    expected = con.execute("SELECT * FROM s ORDER BY signal_id").df()
+    full = read_table(path, 'signals')
+    assert set(full.columns) == set(expected.columns)
+    got = full.sort_values('signal_id', ignore_index=True)[list(expected.columns)]
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, check_categorical=False)
+
+    # parquet() numbers rows in the order schema readers return them (the index relies on it)
+    stored = con.execute(f"SELECT signal_id FROM {parquet(path)} ORDER BY file_row_number").df()['signal_id']
+    assert stored.tolist() == read_frame(path)['signal_id'].tolist()
+
+    # Partition pruning gives what a full read plus a pandas filter gives
+    filtered = read_table(path, 'signals', [('study_id', 'in', ['st/1 %', None]), ('domain', '==', 'Safety')])
+    mask = (full['study_id'].isna() | (full['study_id'] == 'st/1 %')) & (full['domain'] == 'Safety')
+    pd.testing.assert_frame_equal(filtered, full[mask.to_numpy(dtype=bool)].reset_index(drop=True),
+                                  check_categorical=False)
+
+    empty = tmp_path / "empty.parquet"
+    copy_partitioned(con, "SELECT * FROM s WHERE false", empty, 'signals', "signal_id")
+    assert read_table(empty, 'signals').empty
+    assert list(read_table(empty, 'signals').columns) == list(expected.columns)
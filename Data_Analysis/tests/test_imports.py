@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PHASE_MODULES = [
+    'Phase_2_Ingestion.ingest_studies',
+    'Phase_3_Risk_Signals.compute_signals',
+    'Phase_3_Risk_Signals.compute_signals_duckdb',
+    'Phase_4_Aggregation.compute_dqi',
+    'Phase_4_Aggregation.compute_dqi_duckdb',
+    'Phase_9_GenAI.build_index',
+]
+
+# Runs in a fresh interpreter: imports every phase module and reports what changed
+PROBE = """
+import importlib, json, logging, os, sys
+
+def folders(root):
+    return sorted(d for d, subdirs, _ in os.walk(root) if '__pycache__' not in d)
+
+root, base = sys.argv[1], sys.argv[2]
+path, before = list(sys.path), folders(root)
+for name in sys.argv[3:]:
+    importlib.import_module(name)
+loggers = [logging.getLogger()] + [l for l in logging.Logger.manager.loggerDict.values() if isinstance(l, logging.Logger)]
+print(json.dumps({
+    'path_changed': sys.path != path,
+    'new_folders': sorted(set(folders(root)) - set(before)) + os.listdir(base),
+    'handlers': [l.name for l in loggers if l.handlers],
+    'heavy_modules': [m for m in ('pandas', 'pyarrow', 'jsonschema', 'duckdb') if m in sys.modules],
+}))
+"""
+
+
+def test_importing_the_phase_modules_has_no_side_effects(tmp_path):
+    base = tmp_path / "base"
+    base.mkdir()
+    env = {**os.environ, 'PIPELINE_BASE_DIR': str(base)}
+    out = subprocess.run([sys.executable, "-c", PROBE, str(ROOT_DIR), str(base), *PHASE_MODULES],
+                         cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True)
+    assert json.loads(out.stdout) == {'path_changed': False, 'new_folders': [], 'handlers': [], 'heavy_modules': []}
@@ -0,0 +1,123 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from Phase_2_Ingestion import ingest_studies
+from Phase_2_Ingestion.ingest_studies import IngestionEngine, upsert_dimension
+from pipeline.config import PipelineConfig
+from pipeline.schema import read_table
+
+
+def test_upsert_takes_each_column_from_the_best_ranked_source():
+    df = pd.DataFrame([
+        {'SubjectID': 'S1', 'SiteID': 'Site MP', 'OpenIssueCount': None, 'trace_id': 't1'},
+        {'SubjectID': 'S2', 'SiteID': None, 'OpenIssueCount': 3, 'trace_id': 't2'},
+        {'SubjectID': 'S1', 'SiteID': None, 'OpenIssueCount': 7, 'trace_id': 't3'},
+        {'SubjectID': 'S1', 'SiteID': 'Site EDC', 'OpenIssueCount': None, 'trace_id': 't4'},
+        {'SubjectID': None, 'SiteID': 'Site X', 'OpenIssueCount': None, 'trace_id': 't5'},
+    ])
+    sources = ['Study_1_Missing_Pages.xlsx', 'Study_1_EDRR.xlsx', 'Study_1_EDRR.xlsx',
+               'Study_1_EDC_Metrics.xlsx', 'Study_1_EDC_Metrics.xlsx']
+    out = upsert_dimension(df, 'SubjectID', sources)
+
+    # first-arrival key order, rows without a key kept at the end
+    assert out['SubjectID'].iloc[:2].tolist() == ['S1', 'S2']
+    assert pd.isna(out['SubjectID'].iloc[2]) and out['trace_id'].iloc[2] == 't5'
+    s1 = out.iloc[0]
+    assert s1['SiteID'] == 'Site EDC'               # EDC_Metrics outranks Missing_Pages
+    assert s1['OpenIssueCount'] == 7                # only EDRR has it
+    assert s1['trace_id'] == 't4'                   # the best-ranked row's trace
+    assert out.iloc[1]['OpenIssueCount'] == 3
+
+
+def ingest(source_dir, canonical_dir):
+    return IngestionEngine(source_dir=source_dir, canonical_dir=canonical_dir, prefetch=0).run()
+
+
+def by_key(df, key):
+    return df.sort_values(key, kind='stable').reset_index(drop=True).astype(object).where(df.notna(), None)
+
+
+@pytest.mark.parametrize('study', [{'scale': 1 / 23, 'seed': 3}], indirect=True)
+def test_incremental_reingest_matches_full_reingest(study):
+    src = study / "src"
+    edrr = next(src.glob("Study_1_Input_Files/*_EDRR.parquet"))
+    shutil.copytree(study / "canonical", study / "incremental")
+
+    # Every EDRR count changes, including subjects EDC_Metrics also provides
+    changed = pd.read_parquet(edrr).assign(**{"Total Open issue Count per subject": 999})
+    updated = study / "src_updated"
+    shutil.copytree(src, updated)
+    changed.to_parquet(updated / edrr.relative_to(src), index=False)
+
+    engine = IngestionEngine(source_dir=updated, canonical_dir=study / "incremental", prefetch=0)
+    _, incremental = engine.ingest_file(updated / edrr.relative_to(src))
+    full = ingest(updated, study / "full")
+
+    subjects = incremental['subject']
+    edrr_subjects = {f"Study_1_{s}" for s in changed['Subject']}
+    assert (subjects.loc[subjects['SubjectID'].isin(edrr_subjects), 'OpenIssueCount'] == 999).all()
+    for name, key in [('study', 'StudyID'), ('site', 'SiteID'), ('subject', 'SubjectID')]:
+        pd.testing.assert_frame_equal(by_key(incremental[name], key), by_key(full[name], key), check_dtype=False)
+    for name in ['query', 'form', 'provenance']:
+        assert len(incremental[name]) == len(full[name])
+
+
+def test_prefetched_reads_give_the_same_tables(study, tmp_path):
+    # The shipped default decodes upcoming sheets on reader threads; the fixture ingests inline
+    IngestionEngine(source_dir=study / "src", canonical_dir=tmp_path, prefetch=2).run()
+    names = sorted(p.name for p in (study / "canonical").glob("*.parquet"))
+    assert 'provenance.parquet' in names and names == sorted(p.name for p in tmp_path.glob("*.parquet"))
+    for name in names:
+        table = name.removesuffix('.parquet')
+        inline = read_table(study / "canonical" / name, table).drop(columns='ingestion_timestamp', errors='ignore')
+        prefetched = read_table(tmp_path / name, table).drop(columns='ingestion_timestamp', errors='ignore')
+        assert len(inline) > 0
+        pd.testing.assert_frame_equal(prefetched, inline)
+
+
+def test_reingesting_a_file_replaces_its_quarantined_rows(study):
+    shutil.copytree(study / "canonical", study / "requarantine")
+    quarantine_dir = study / "requarantine/Quarantine"
+    before = {p.name: pd.read_csv(p) for p in quarantine_dir.glob("*_invalid.csv")}
+    meddra = next((study / "src").glob("Study_1_Input_Files/*MedDRA*.parquet"))
+    mine = {name for name in before if name.startswith(f"1_{meddra.stem}_")}
+    assert mine, "the synthetic MedDRA file should quarantine some rows"
+
+    for _ in range(2):
+        engine = IngestionEngine(source_dir=study / "src", canonical_dir=study / "requarantine", prefetch=0)
+        engine.ingest_file(meddra)
+    after = {p.name: pd.read_csv(p) for p in quarantine_dir.glob("*_invalid.csv")}
+    assert set(after) == set(before)
+    for name, df in before.items():
+        pd.testing.assert_frame_equal(after[name], df)
+
+
+def test_watch_writes_every_output_under_its_config(study, tmp_path, monkeypatch):
+    config = PipelineConfig(tmp_path)
+    config.schema_file, config.weights_file = PipelineConfig().schema_file, PipelineConfig().weights_file
+    shutil.copytree(study / "src", config.source_dir)
+    shutil.copytree(study / "canonical", config.canonical_dir)
+    edrr = next(config.source_dir.glob("Study_1_Input_Files/*_EDRR.parquet"))
+
+    class Stop(Exception):
+        pass
+
+    sleeps = []
+    def sleep(seconds):
+        # 1st: an updated EDRR lands; 2nd: it is stable; 3rd: it has been ingested
+        sleeps.append(seconds)
+        if len(sleeps) == 1:
+            pd.read_parquet(edrr).assign(**{"Total Open issue Count per subject": 999}).to_parquet(edrr, index=False)
+        elif len(sleeps) == 3:
+            raise Stop
+    monkeypatch.setattr(ingest_studies.time, 'sleep', sleep)
+
+    with pytest.raises(Stop):
+        ingest_studies.watch(config, interval=0, debounce=0)
+    subjects = read_table(config.canonical_dir / "subject.parquet", 'subject')
+    assert (subjects['OpenIssueCount'] == 999).any()
+    assert (config.signal_dir / "signals.parquet").exists()
+    assert (config.dqi_dir / "ranked_subjects.parquet").exists()
+    assert (config.ui_dir / "files.json").exists()
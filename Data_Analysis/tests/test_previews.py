@@ -0,0 +1,192 @@
+import json
+import os
+import shutil
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from pipeline import previews
+from pipeline.metrics import METRICS
+from pipeline.previews import PreviewIndex, list_tables, preview_csv, preview_parquet, preview_xlsx
+from pipeline.schema import write_table
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+def write_workbook(path, first_subject="Subject 1"):
+    # Two sheets; the first has a blank and a repeated header and trailing empty rows
+    workbook = openpyxl.Workbook()
+    summary = workbook.active
+    summary.title = "Summary"
+    summary.append(["Subject", None, "Count", "Count"])
+    for i in range(8):
+        summary.append([first_subject if i == 0 else f"Subject {i + 1}", None, i, i * 2])
+    summary.append([None, None, None, None])
+    notes = workbook.create_sheet("Notes")
+    notes.append(["Note"])
+    notes.append(["checked"])
+    workbook.save(path)
+
+
+@pytest.fixture
+def config(tmp_path):
+    # One file of each kind the Files view lists, plus files it has to skip
+    config = SimpleNamespace(source_dir=tmp_path / "src", canonical_dir=tmp_path / "canonical",
+                             signal_dir=tmp_path / "signals", dqi_dir=tmp_path / "dqi", ui_dir=tmp_path / "ui")
+    raw = config.source_dir / "Study_1_Input_Files"
+    raw.mkdir(parents=True)
+    write_workbook(raw / "Study_1_EDRR.xlsx")
+    (raw / "~$Study_1_EDRR.xlsx").write_bytes(b"lock")
+    (raw / "Study_1_Notes.csv").write_text("site,comment\n" + "".join(f"{i},note {i}\n" for i in range(8)))
+
+    config.canonical_dir.mkdir()
+    subjects = pd.DataFrame({'SubjectID': [f"Study_1_Subject {i}" for i in range(8)], 'OpenIssueCount': range(8)})
+    write_table(subjects, config.canonical_dir / "subject.parquet", 'subject')
+    (config.canonical_dir / ".spill").mkdir()
+    write_table(subjects, config.canonical_dir / ".spill/subject.parquet")
+
+    config.dqi_dir.mkdir()
+    ranked = pd.DataFrame({'study_id': ['2', '1', '1', '2', '1', '1', '1'],
+                           'entity_id': [f"S{i}" for i in range(7)], 'dqi_score': [0.5] * 7})
+    write_table(ranked, config.dqi_dir / "ranked_subjects.parquet", 'ranked_subjects')
+    return config
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    # Names of the files hash_table reads; the size/mtime check should spare unchanged ones
+    names = []
+    hash_table = previews.hash_table
+    def spy(path):
+        names.append(path.name)
+        return hash_table(path)
+    monkeypatch.setattr(previews, 'hash_table', spy)
+    return names
+
+
+def run(config):
+    # (manifest, {path: entry}, counter deltas) of one PreviewIndex run
+    before = dict(METRICS.counters)
+    manifest = PreviewIndex(config).run()
+    delta = {k: METRICS.counters.get(k, 0) - before.get(k, 0) for k in ('previews_built', 'previews_reused')}
+    entries = {entry['path']: entry for entries in manifest.values() for entry in entries}
+    return manifest, entries, delta
+
+
+def shards(config):
+    # shard file name -> mtime_ns
+    return {p.name: p.stat().st_mtime_ns for p in (config.ui_dir / "file_previews").glob("*.json")}
+
+
+def read_shard(config, entry):
+    with open(config.ui_dir / entry['preview_shard']) as f:
+        return json.load(f)
+
+
+def test_list_tables_skips_lock_files_and_hidden_folders(config):
+    assert [p.name for p in list_tables(config.source_dir)] == ["Study_1_EDRR.xlsx", "Study_1_Notes.csv"]
+    assert list_tables(config.canonical_dir) == [config.canonical_dir / "subject.parquet"]
+    # A partitioned dataset is one table
+    assert list_tables(config.dqi_dir) == [config.dqi_dir / "ranked_subjects.parquet"]
+
+
+def test_readers(config):
+    preview = preview_xlsx(config.source_dir / "Study_1_Input_Files/Study_1_EDRR.xlsx", 5)
+    assert preview['type'] == 'multi' and list(preview['sheets']) == ["Summary", "Notes"]
+    summary = preview['sheets']["Summary"]
+    assert summary['columns'] == ["Subject", "Unnamed: 1", "Count", "Count.1"]
+    assert summary['rows'][:2] == [["Subject 1", "", "0", "0"], ["Subject 2", "", "1", "2"]]
+    assert len(summary['rows']) == 5
+    assert preview['sheets']["Notes"] == {'columns': ["Note"], 'rows': [["checked"]]}
+
+    preview = preview_csv(config.source_dir / "Study_1_Input_Files/Study_1_Notes.csv", 5)
+    assert preview == {'type': 'single', 'columns': ["site", "comment"],
+                       'rows': [[str(i), f"note {i}"] for i in range(5)]}
+
+    preview = preview_parquet(config.canonical_dir / "subject.parquet", 5)
+    assert preview['columns'] == ["SubjectID", "OpenIssueCount"]
+    assert preview['rows'] == [[f"Study_1_Subject {i}", str(i)] for i in range(5)]
+
+    # Partition values come back from the directory names, in the dataset's column order
+    preview = preview_parquet(config.dqi_dir / "ranked_subjects.parquet", 5)
+    assert preview['columns'] == ["study_id", "entity_id", "dqi_score"]
+    assert preview['rows'][0][0] == "1" and len(preview['rows']) == 5
+
+
+def test_rerun_rewrites_only_the_changed_files_shard(config, hashed):
+    manifest, first, delta = run(config)
+    assert set(manifest) == {'raw', 'canonical', 'signals', 'aggregates'} and manifest['signals'] == []
+    assert delta == {'previews_built': 4, 'previews_reused': 0}
+    assert first["Study_1_Input_Files/Study_1_EDRR.xlsx"]['sheets'] == ["Summary", "Notes"]
+    assert first["ranked_subjects.parquet"]['size'] > 0
+    assert read_shard(config, first["subject.parquet"])['rows'][0] == ["Study_1_Subject 0", "0"]
+    before = shards(config)
+    assert len(before) == 4
+
+    # Nothing changed: every shard is reused and the manifest is the same
+    hashed.clear()
+    _, again, delta = run(config)
+    assert hashed == []
+    assert delta == {'previews_built': 0, 'previews_reused': 4}
+    assert again == first and shards(config) == before
+
+    # A new version of one workbook: its shard is replaced, the rest are left alone
+    workbook = "Study_1_Input_Files/Study_1_EDRR.xlsx"
+    write_workbook(config.source_dir / workbook, first_subject="Subject 99")
+    hashed.clear()
+    manifest, second, delta = run(config)
+    assert hashed == ["Study_1_EDRR.xlsx"]
+    assert delta == {'previews_built': 1, 'previews_reused': 3}
+    assert second[workbook]['sha256'] != first[workbook]['sha256']
+    assert second[workbook]['preview_shard'] != first[workbook]['preview_shard']
+    assert read_shard(config, second[workbook])['sheets']["Summary"]['rows'][0][0] == "Subject 99"
+    assert {path: entry for path, entry in second.items() if path != workbook} == \
+           {path: entry for path, entry in first.items() if path != workbook}
+    after = shards(config)
+    old_shard = first[workbook]['preview_shard'].rsplit('/', 1)[1]
+    assert old_shard not in after
+    assert {name: t for name, t in after.items() if name in before} == \
+           {name: t for name, t in before.items() if name != old_shard}
+
+    with open(config.ui_dir / "files.json") as f:
+        assert json.load(f) == manifest
+
+
+def test_touched_and_copied_files_reuse_their_shard(config, hashed):
+    _, first, _ = run(config)
+    before = shards(config)
+
+    # A touch changes the mtime but not the hash; a copy has the same content as its original
+    csv = config.source_dir / "Study_1_Input_Files/Study_1_Notes.csv"
+    os.utime(csv, ns=(csv.stat().st_atime_ns, csv.stat().st_mtime_ns + 10**9))
+    shutil.copy(csv, config.source_dir / "Study_1_Input_Files/Study_1_Notes_copy.csv")
+    hashed.clear()
+    _, second, delta = run(config)
+    assert sorted(hashed) == ["Study_1_Notes.csv", "Study_1_Notes_copy.csv"]
+    assert delta == {'previews_built': 0, 'previews_reused': 5}
+    assert shards(config) == before
+
+    notes = "Study_1_Input_Files/Study_1_Notes.csv"
+    assert second[notes]['mtime_ns'] == first[notes]['mtime_ns'] + 10**9
+    assert second[notes]['sha256'] == first[notes]['sha256']
+    assert second["Study_1_Input_Files/Study_1_Notes_copy.csv"]['preview_shard'] == first[notes]['preview_shard']
+
+
+def test_deleted_files_lose_their_shard(config):
+    _, first, _ = run(config)
+    shutil.rmtree(config.dqi_dir / "ranked_subjects.parquet")
+    manifest, _, delta = run(config)
+    assert manifest['aggregates'] == [] and delta == {'previews_built': 0, 'previews_reused': 3}
+    assert first["ranked_subjects.parquet"]['preview_shard'].rsplit('/', 1)[1] not in shards(config)
+    assert len(shards(config)) == 3
+
+
+def test_old_inline_manifest_is_a_cache_miss(config):
+    config.ui_dir.mkdir()
+    legacy = {'raw': [{'name': "Study_1_Notes.csv", 'path': "Study_1_Input_Files/Study_1_Notes.csv",
+                       'preview': {'type': 'single', 'columns': [], 'rows': []}}]}
+    (config.ui_dir / "files.json").write_text(json.dumps(legacy))
+    _, entries, delta = run(config)
+    assert delta == {'previews_built': 4, 'previews_reused': 0}
+    assert 'preview' not in entries["Study_1_Input_Files/Study_1_Notes.csv"]
@@ -0,0 +1,94 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from pipeline.config import ARROW_HANDOFF_ENV, arrow_path
+from pipeline.schema import read_table, sync_arrow_copy, write_table
+
+
+@pytest.fixture
+def signals():
+    return pd.DataFrame({
+        'signal_id': [f"{i:08x}" for i in range(6)],
+        'study_id': ['2', '1', '1', None, '2', '1'],
+        'domain': ['Safety', 'Safety', 'Lab Integrity', 'Safety', 'Safety', 'Lab Integrity'],
+        'entity_type': ['Subject'] * 6,
+        'entity_id': ['S6', 'S5', 'S4', 'S3', 'S2', 'S1'],
+        'normalized_score': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+    })
+
+
+def test_arrow_copy_follows_the_handoff_setting(tmp_path, monkeypatch, signals):
+    path = tmp_path / "signals.parquet"
+    monkeypatch.delenv(ARROW_HANDOFF_ENV, raising=False)
+    write_table(signals, path, 'signals')
+    assert not arrow_path(path).exists()
+
+    # Turned on later: derived from the existing dataset, Parquet untouched
+    monkeypatch.setenv(ARROW_HANDOFF_ENV, "1")
+    before = path.stat().st_mtime_ns
+    assert sync_arrow_copy(path)
+    assert arrow_path(path).exists() and path.stat().st_mtime_ns == before
+    assert not sync_arrow_copy(path)        # already current
+    # the memory-mapped copy reads back as the Parquet does (filtered reads skip the copy)
+    pd.testing.assert_frame_equal(read_table(path, 'signals'),
+                                  read_table(path, 'signals', [('entity_type', '==', 'Subject')]))
+
+    monkeypatch.setenv(ARROW_HANDOFF_ENV, "0")
+    assert not sync_arrow_copy(path)
+    assert not arrow_path(path).exists()
+
+
+@pytest.mark.parametrize('filters, mask', [
+    ([('study_id', '==', '1')], lambda df: df['study_id'] == '1'),
+    ([('study_id', 'in', ['2', None])], lambda df: df['study_id'].isna() | (df['study_id'] == '2')),
+    ([('domain', '==', 'Safety'), ('entity_id', '>=', 'S050')],
+     lambda df: (df['domain'] == 'Safety') & (df['entity_id'] >= 'S050')),
+    ([('normalized_score', '<', 0.25)], lambda df: df['normalized_score'] < 0.25),
+    ([('study_id', '==', '9')], lambda df: df['study_id'] == '9'),
+])
+def test_pruned_reads_match_a_full_read_and_filter(tmp_path, monkeypatch, filters, mask):
+    monkeypatch.delenv(ARROW_HANDOFF_ENV, raising=False)
+    n = 400
+    df = pd.DataFrame({
+        'signal_id': [f"{i:08x}" for i in range(n)],
+        'study_id': [None if i % 11 == 0 else str(i % 3) for i in range(n)],
+        'domain': ['Safety' if i % 2 else 'Lab Integrity' for i in range(n)],
+        'entity_type': ['Subject'] * n,
+        'entity_id': [f"S{i % 97:03d}" for i in range(n)],
+        'normalized_score': [(i * 37 % 100) / 100 for i in range(n)],
+    })
+    path = tmp_path / "signals.parquet"
+    write_table(df, path, 'signals', row_group_size=8)     # many row groups to skip
+
+    full = read_table(path, 'signals')
+    expected = full[mask(full).fillna(False).to_numpy(dtype=bool)].reset_index(drop=True)
+    got = read_table(path, 'signals', filters)
+    if expected.empty:
+        # apply_schema leaves empty frames untyped
+        assert got.empty and list(got.columns) == list(expected.columns)
+    else:
+        pd.testing.assert_frame_equal(got, expected, check_categorical=False)
+
+
+def test_sync_arrow_copy_without_work_does_not_import_pyarrow(tmp_path):
+    # Cached runs call it for every table; the check is stat-only
+    import subprocess
+    import sys
+
+    (tmp_path / "t.parquet").write_bytes(b"stands in for a table")
+    (tmp_path / "fresh.parquet").write_bytes(b"")
+    (tmp_path / "fresh.arrow").write_bytes(b"")
+    code = (
+        "import os, sys\n"
+        "from pipeline.schema import sync_arrow_copy\n"
+        f"os.environ.pop({ARROW_HANDOFF_ENV!r}, None)\n"
+        f"assert not sync_arrow_copy({str(tmp_path / 't.parquet')!r})\n"
+        f"os.environ[{ARROW_HANDOFF_ENV!r}] = '1'\n"
+        f"assert not sync_arrow_copy({str(tmp_path / 'fresh.parquet')!r})\n"
+        "print(sorted(m for m in ('pyarrow', 'pandas') if m in sys.modules))\n"
+    )
+    root = Path(__file__).resolve().parent.parent
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+
+from Phase_3_Risk_Signals.compute_signals import SignalEngine
+from pipeline.schema import read_table
+from pipeline.subject_store import ENTITY_TABLES, ROW_KEY, SubjectStore
+
+
+@pytest.fixture(scope='module')
+def signal_dir(study):
+    output_dir = study / "subject_store/signals"
+    SignalEngine(canonical_dir=study / "canonical", output_dir=output_dir).run_all()
+    return output_dir
+
+
+def owners(df, provenance):
+    # Subject of every row of `df` the slow way: the row's provenance record, then the
+    # Subject record written from the same source row
+    subjects = (provenance.loc[provenance['canonical_entity'] == 'Subject', ROW_KEY + ['entity_id']]
+                .drop_duplicates(subset=ROW_KEY))
+    linked = provenance[['trace_id'] + ROW_KEY].merge(subjects, on=ROW_KEY).drop_duplicates(subset='trace_id')
+    return df['trace_id'].map(linked.set_index('trace_id')['entity_id'])
+
+
+def assert_same_rows(got, expected):
+    # A row-group read only sees the categories present in those groups
+    pd.testing.assert_frame_equal(got, expected, check_categorical=False, check_dtype=False)
+
+
+def owned_tables(canonical_dir, provenance):
+    # name -> (table, subject of each row)
+    out = {}
+    for name in ENTITY_TABLES:
+        path = canonical_dir / f"{name}.parquet"
+        if path.exists():
+            df = read_table(path, name)
+            out[name] = df, owners(df, provenance).to_numpy()
+    return out
+
+
+def test_subject_lookup_matches_a_pandas_filter(study):
+    canonical_dir = study / "canonical"
+    provenance = read_table(canonical_dir / "provenance.parquet", 'provenance')
+    subject_ids = read_table(canonical_dir / "subject.parquet", 'subject')['SubjectID'].dropna().unique()
+    assert len(subject_ids) > 1
+
+    from_disk = SubjectStore(canonical_dir)
+    in_memory = SubjectStore(canonical_dir)
+    for name in in_memory.paths:
+        in_memory.table(name)
+    tables = owned_tables(canonical_dir, provenance)
+    total = 0
+    for sid in subject_ids:
+        expected = {name: df[owner == sid] for name, (df, owner) in tables.items()}
+        for store in (from_disk, in_memory):
+            got = store.get(sid)
+            assert set(got) == set(expected)
+            for name, df in expected.items():
+                assert_same_rows(got[name], df)
+        total += sum(len(df) for df in expected.values())
+    assert total > 0
+    assert "no such subject" not in from_disk
+    assert all(df.empty for df in from_disk.get("no such subject").values())
+
+
+def test_signal_lookup_matches_a_pandas_filter(study, signal_dir):
+    signals = read_table(signal_dir / "signals.parquet", 'signals')
+    traces = pd.read_parquet(signal_dir / "signal_traces.parquet")
+    provenance = read_table(study / "canonical/provenance.parquet", 'provenance')
+
+    first = traces.drop_duplicates(subset='signal_id').set_index('signal_id')['trace_id']
+    owner = owners(pd.DataFrame({'trace_id': signals['signal_id'].map(first)}), provenance)
+    owner = signals['entity_id'].where(signals['entity_type'] == 'Subject', owner)
+
+    store = SubjectStore(study / "canonical", signal_dir)
+    for sid in owner.dropna().unique():
+        assert_same_rows(store.get(sid, ['signals'])['signals'], signals[(owner == sid).to_numpy()])